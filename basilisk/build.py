@@ -1,4 +1,7 @@
 import os
+from .content import Content
+from .outputs import DirectoryOutputs
+from . import front_matter
 from . import logging
 
 
@@ -16,17 +19,30 @@ class Build(object):
         self.input_path = input_path
         self.output_path = output_path
 
+        # Output path before it was changed by the modules in the pipeline.
+        # Used to run the pipeline again in another process, see executors.
+        self.initial_output_path = output_path
+
         # A list of functions which will be used to process the contents of the
         # input file before saving it in the output file. Think about this in
         # terms of running the input through a series of pipes.
         # Expected function signature:
-        # processor(content: str, context: dict) -> str
+        # processor(content: bytes, context: dict) -> bytes
+        # Processors can define an attribute `content_type` to receive text
+        # or a parsed document instead of bytes, see Content. Processors which
+        # don't use the context can define an attribute `cache_identity` to
+        # have their results memoized, see Cache.process.
         self.processors = []
 
         # Additional context which will be passed to processors.
         # See Build.get_context and Build.execute.
         self.additional_context = {}
 
+        # Paths to the files other than the input file which were used to
+        # create the output, relative to the source directory. Populated by the
+        # processors, see Manifest.
+        self.dependencies = set()
+
     def __str__(self):
         return '%s->%s' % (self.input_path, self.output_path)
 
@@ -34,6 +50,21 @@ class Build(object):
         return '<%s.%s %s>' % (self.__module__, self.__class__.__name__,
                                self.__str__())
 
+    def __getstate__(self):
+        # Processors and methods replaced by the modules are closures which
+        # can't be pickled. They are recreated by running the pipeline again.
+        state = self.__dict__.copy()
+        state['processors'] = []
+        state.pop('read', None)
+        state.pop('execute', None)
+        return state
+
+    def reads_input_file(self):
+        """Returns True if the content is read from the input file as opposed
+        to being generated or produced by a command.
+        """
+        return type(self).read is Build.read and not 'read' in vars(self)
+
     def read(self, path) -> bytes:
         """Reads and returns the lines of the input file.
 
@@ -49,32 +80,13 @@ class Build(object):
         else after those `key: value` pairs is considered to be the content of
         the file and returned as the first element of a tuple. Parameters must
         be separated from content with a blank line or the first line of
-        content can't contain a ':' character.
+        content can't contain a ':' character. Content which is not valid
+        UTF-8 is returned unchanged without parameters. The returned content
+        can be a memoryview of the provided content, see front_matter.parse.
 
         content: bytes most likely loaded from the input file.
         """
-        try:
-            lines = content.decode().splitlines(True)
-        except UnicodeDecodeError:
-            return content, {}
-
-        parameters = {}
-        remaining_content = ''
-        for line in lines:
-            if not remaining_content:
-                parameter = self.read_parameter(line)
-                if parameter:
-                    parameters.update(parameter)
-                    continue
-            remaining_content += line
-
-        if remaining_content.startswith('\r\n'):
-            remaining_content = remaining_content[2:]
-        else:
-            if remaining_content.startswith('\n'):
-                remaining_content = remaining_content[1:]
-
-        return (remaining_content.encode(), parameters)
+        return front_matter.parse(content, self.read_parameter)
 
     def read_parameter(self, line):
         """Reads a parameter from a line of text. Parameters are structured in
@@ -94,16 +106,17 @@ class Build(object):
             return {key: value}
         return {}
 
-    def write(self, output_directory, content: bytes):
-        """Writes content to the output file.
+    def write(self, output_directory, content: bytes, outputs=None):
+        """Writes content to the output file. The file is replaced atomically so
+        that the development server never serves a partially written file.
 
         content: This will be written to the output file.
+        outputs: the backend storing the outputs, defaults to the files in the
+                 output directory, see DirectoryOutputs.
         """
-        path = os.path.join(output_directory, self.output_path)
-        directory = os.path.dirname(path)
-        os.makedirs(directory, exist_ok=True)
-        with open(path, 'wb') as f:
-            f.write(content)
+        if outputs is None:
+            outputs = DirectoryOutputs(output_directory)
+        outputs.write(self.output_path, content)
 
     def get_context(self, parameters, config):
         """Creates the context which is passed to the processors. The context
@@ -118,14 +131,30 @@ class Build(object):
         context.update(self.additional_context)
         return context
 
-    def execute(self, config, source_directory, output_directory):
+    def execute(self, config, source_directory, output_directory, sources=None,
+                cache=None, outputs=None):
         """Runs the build. Reads the input file, runs the content through
         processors and saves it in the output file.
+
+        sources: a SourceStore which should be used to read the input file.
+        cache: a Cache which should be used to run the processors.
+        outputs: the backend storing the outputs, see Build.write.
         """
-        inpath = os.path.join(source_directory, self.input_path)
-        content = self.read(inpath)
-        content, parameters = self.extract_parameters(content)
-        for p in self.processors:
-            context = self.get_context(parameters, config)
-            content = p(content, context)
-        self.write(output_directory, content)
+        if sources is not None:
+            content, parameters = sources.extract(self)
+        else:
+            inpath = os.path.join(source_directory, self.input_path)
+            content = self.read(inpath)
+            content, parameters = self.extract_parameters(content)
+        content = Content(content)
+        context = self.get_context(parameters, config)
+        for i, p in enumerate(self.processors):
+            value = content.get(getattr(p, 'content_type', 'bytes'))
+            # The result of the last processor is the output which is already
+            # cached as a whole, see Builder.execute.
+            if cache is not None and i < len(self.processors) - 1:
+                value = cache.process(p, value, context)
+            else:
+                value = p(value, context)
+            content = Content(value)
+        self.write(output_directory, content.get('bytes'), outputs)
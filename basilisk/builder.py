@@ -1,12 +1,21 @@
 import os
-import fnmatch
+import time
 import tqdm
+import threading
 import concurrent.futures
 from .build import Build
 from .config import Config
-from .exceptions import BuildException
+from .exceptions import BuildException, BuildCancelled
 from .helpers import import_by_name, remove_directory_contents
-from .cache import Cache
+from .cache import Cache, cache_directory
+from .manifest import Manifest
+from .outputs import DirectoryOutputs
+from .sources import SourceStore, ParametersIndex, DigestIndex
+from .scanner import Scanner
+from .pipelines import Pipelines
+from .scheduler import Scheduler, DurationIndex
+from .fingerprint import Fingerprinter
+from .executors import ThreadExecutor, ProcessExecutor
 from . import logging
 
 
@@ -27,27 +36,71 @@ class Builder(object):
     source_directory: root directory of the project to build.
     output_directory: output directory.
     config_file: path to the config file relative to the source directory root.
+    outputs: the backend storing the outputs, defaults to the files in the
+             output directory, see MemoryOutputs.
     """
 
     # Default class used for config.
     config_class = Config
 
+    # Executors which can be selected using the `executor` config key.
+    executor_classes = {
+        'thread': ThreadExecutor,
+        'process': ProcessExecutor,
+    }
+
     # Default config values.
-    default_config = {
+    default_config: dict = {
         # Modules to load.
         'modules': ['pretty_urls', 'html'],
 
         # Prefixed files are not added to the initial build list.
         'ignore_prefix': '_',
+
+        # Executor used to run the builds, see executor_classes.
+        'executor': 'thread',
+
+        # Maximum number of builds executed at the same time, null picks the
+        # default of the executor.
+        'jobs': None,
+
+        # Maximum total size of the cached outputs in bytes, null picks the
+        # default of the cache.
+        'cache_size': None,
+
+        # Cache shared by many machines: a path to a directory, a file:// URL
+        # or an http(s):// URL, see Cache.
+        'remote_cache': None,
+
+        # If true outputs are only retrieved from the remote cache and never
+        # sent to it.
+        'remote_cache_readonly': False,
+
+        # If true input files whose size and modification time didn't change
+        # are not hashed again to check if their outputs are up to date, see
+        # Manifest.
+        'trust_mtime': False,
+
+        # Maximum total size of the input files of the builds executed at the
+        # same time in bytes, null disables the limit, see Scheduler.
+        'memory_budget': None,
+
+        # Maximum numbers of builds using a module executed at the same time
+        # keyed by module names, for example {"resize": 2}.
+        'module_jobs': {},
     }
 
     def __init__(self, source_directory, output_directory,
                  config_file='_config.json',
-                 progress=False):
+                 progress=False, executor=None, jobs=None, trust_mtime=None,
+                 outputs=None):
         self.source_directory = source_directory
         self.output_directory = output_directory
         self.test_directories()
 
+        # Backend storing the outputs.
+        self.outputs = outputs or DirectoryOutputs(output_directory)
+
         self.progress = progress
 
         # Path to the config file. This file will be loaded from the source
@@ -56,14 +109,57 @@ class Builder(object):
 
         # Config dictionary.
         self.config = self.get_config()
+        if executor is not None:
+            self.config['executor'] = executor
+        if jobs is not None:
+            self.config['jobs'] = jobs
+        if trust_mtime is not None:
+            self.config['trust_mtime'] = trust_mtime
 
         # List of callables which are passed a file path and return True if that
         # path should be ignored.
         self.ignored = []
 
+        # List of callables which are passed a directory path and return True
+        # if that directory and all files located in it should be ignored.
+        self.ignored_directories = []
+
         self.module_cache = {}
 
-        self.build_cache = Cache(self.config, self.source_directory, self.output_directory)
+        # Set while the builder is running and the Scheduler executing the
+        # builds, see prioritize.
+        self.state = threading.Condition()
+        self.running = False
+        self.scheduler = None
+
+        # Set to stop the current run, see cancel.
+        self.cancelled = threading.Event()
+
+        # Tuples (module_definitions, modules) keyed by ids of the lists of
+        # module definitions, see iter_modules.
+        self.resolved_modules = {}
+
+        # Pipelines defined in the config.
+        self.pipelines = Pipelines(self.config.get('pipelines', []))
+        self.validate_module_jobs()
+
+        # Contents of the input files shared by all phases of the run.
+        index = ParametersIndex(cache_directory('index', 'parameters.sqlite'),
+                                self.source_directory)
+        digest_index = DigestIndex(cache_directory('index', 'digests.sqlite'),
+                                   self.source_directory)
+        self.sources = SourceStore(self.source_directory, index, digest_index)
+
+        # Durations of the builds executed during the previous runs.
+        self.durations = DurationIndex(cache_directory('index', 'durations.sqlite'),
+                                       self.source_directory)
+
+        # Digests of the config and the context shared by all builds.
+        self.fingerprints = Fingerprinter()
+
+        self.build_cache = Cache(self.config, self.source_directory,
+                                 self.output_directory, self.sources,
+                                 self.fingerprints, self.outputs)
 
         self.init_ignored()
 
@@ -74,8 +170,11 @@ class Builder(object):
             raise BuildException('Source directory does not exist.')
 
         # Check if the output directory is empty and offer to delete its
-        # contents otherwise.
+        # contents otherwise. Directories containing outputs of a previous run
+        # are updated instead.
         if os.path.exists(self.output_directory):
+            if Manifest.exists(self.output_directory):
+                return
             if os.listdir(self.output_directory):
                 msg = 'Output directory is not empty.'
                 logger.error(msg)
@@ -90,14 +189,27 @@ class Builder(object):
         config values and then updated with the values from the config file
         located in the source directory.
         """
-        config = self.config_class(self.default_config)
+        return self.load_config(self.source_directory, self.config_file)
+
+    @classmethod
+    def load_config(cls, source_directory, config_file='_config.json'):
+        """Loads the config of a project without creating a builder, see
+        get_config.
+        """
+        config = cls.config_class(cls.default_config)
         try:
-            config_path = os.path.join(self.source_directory, self.config_file)
+            config_path = os.path.join(source_directory, config_file)
             config.from_json_file(config_path)
         except FileNotFoundError:
             logger.warning('Project does not contain the config file.')
         return config
 
+    def validate_module_jobs(self):
+        module_jobs = self.config.get('module_jobs', None) or {}
+        for name, jobs in module_jobs.items():
+            if not isinstance(jobs, int) or jobs < 1:
+                raise ValueError('invalid number of jobs for module {}'.format(name))
+
     def init_ignored(self):
         """Adds callables used to detect files which should be ignored and not
         added to the initial build list.
@@ -110,10 +222,10 @@ class Builder(object):
 
         # Ignore if any part of the path starts with ignore prefix.
         def ignore_prefixed(path):
-            for part in path.split(os.sep):
-                if part.startswith(self.config['ignore_prefix']):
-                    return True
+            prefix = self.config['ignore_prefix']
+            return path.startswith(prefix) or os.sep + prefix in path
         self.ignored.append(ignore_prefixed)
+        self.ignored_directories.append(ignore_prefixed)
 
     def load_module(self, module_name):
         """Loads a single module.
@@ -139,16 +251,26 @@ class Builder(object):
         return self.module_cache[module_name]
 
     def get_pipeline(self, build):
-        for pipeline in self.config['pipelines']:
-            if not 'patterns' in pipeline:
-                raise ValueError('missing property: patterns')
-            for pattern in pipeline['patterns']:
-                if fnmatch.fnmatch(build.input_path, pattern):
-                    return pipeline
-        return None
+        return self.pipelines.get(build.input_path)
+
+    def builds_by_pipeline(self, builds=None):
+        """Returns a list of tuples (pipeline, builds) with the builds grouped
+        by their pipelines, see Pipelines.group.
+
+        builds: builds to group, all builds by default.
+        """
+        if builds is None:
+            builds = self.builds
+        return self.pipelines.group(builds)
 
     def iter_modules(self, module_definitions):
-        return iter([(self.get_module(module_definition['name']), module_definition.get('config', None)) for module_definition in module_definitions])
+        # Lists of modules are resolved once for each list of definitions.
+        entry = self.resolved_modules.get(id(module_definitions), None)
+        if entry is None or entry[0] is not module_definitions:
+            modules = [(self.get_module(module_definition['name']), module_definition.get('config', None)) for module_definition in module_definitions]
+            entry = (module_definitions, modules)
+            self.resolved_modules[id(module_definitions)] = entry
+        return iter(entry[1])
 
     def iter_global_modules(self):
         """Iterates over global modules defined in the config."""
@@ -169,73 +291,228 @@ class Builder(object):
                 return False
         return True
 
+    def should_descend(self, path):
+        """Decides if files located in a directory should be scanned.
+
+        path: Path to the directory relative to the source directory root.
+        """
+        for method in self.ignored_directories:
+            if method(path):
+                return False
+        return True
+
     def builds_generator(self):
         """Yields initial Build objects. All files in the source directory are
         scanned. For each file a build object is created and the output path is
-        set to the relative path in the source directory.
+        set to the relative path in the source directory. The results of
+        os.stat obtained while scanning are passed to the SourceStore.
         """
-        base_path_length = len(self.source_directory) + 1
-
-        for (dirpath, dirnames, filenames) in os.walk(self.source_directory):
-            subdirectory = dirpath[base_path_length:]
-            for filename in filenames:
-                input_path = os.path.join(subdirectory, filename)
-                if not self.should_build(input_path):
-                    continue
-
-                output_path = input_path
-
-                build = Build(input_path, output_path)
-                logger.debug('Yielding object: %s', build)
-                yield build
-
-    def add_build(self, build):
-        for (module, module_config) in self.iter_build_modules(build):
+        scanner = Scanner(self.source_directory,
+                          lambda path: not self.should_descend(path),
+                          lambda path: not self.should_build(path))
+        for input_path, stat in scanner.scan():
+            if stat is not None:
+                self.sources.add_stat(input_path, stat)
+
+            output_path = input_path
+
+            build = Build(input_path, output_path)
+            logger.debug('Yielding object: %s', build)
+            yield build
+
+    def apply_pipeline(self, build, pipeline):
+        """Executes the modules defined in the pipeline on a build."""
+        if pipeline is None:
+            raise BuildException('No pipeline matches {}'.format(build.input_path))
+        for (module, module_config) in self.iter_modules(pipeline['modules']):
             logger.debug('Executing module %s', module)
             module.execute(build, module_config)
-        self.builds_modified = True
+
+    def add_build(self, build):
+        self.apply_pipeline(build, self.get_pipeline(build))
         self.builds.append(build)
 
+    def add_builds(self, builds):
+        """Adds many builds executing each module of a pipeline once for all
+        builds using that pipeline, see Module.execute_many.
+        """
+        builds = list(builds)
+        for pipeline, group in self.builds_by_pipeline(builds):
+            if pipeline is None:
+                raise BuildException('No pipeline matches {}'.format(group[0].input_path))
+            for (module, module_config) in self.iter_modules(pipeline['modules']):
+                logger.debug('Executing module %s on %d builds', module, len(group))
+                module.execute_many(group, module_config)
+        self.builds.extend(builds)
+
+    def create_executor(self):
+        """Creates the executor selected in the config."""
+        name = self.config['executor']
+        if not name in self.executor_classes:
+            raise BuildException('Unknown executor: {}'.format(name))
+        return self.executor_classes[name](self, self.config['jobs'])
+
     def progress_bar(self, *args, **kwargs):
         return tqdm.tqdm(*args, disable=not self.progress, leave=False, miniters=1, **kwargs)
 
-    def run(self):
-        """This is the main function which should be executed to run a build."""
-        self.builds = []
-        self.builds_modified = False
-
-        logger.info('Scanning files')
-        for build in self.builds_generator():
-            self.add_build(build)
-
-        while self.builds_modified:
+    def process_builds(self):
+        """Runs the global modules until none of them creates new builds. Each
+        module is passed only the builds added since it was last called so the
+        total cost is linear in the number of builds, see Module.process.
+        """
+        global_modules = list(self.iter_global_modules())
+        processed = [0] * len(global_modules)
+        while any(n < len(self.builds) for n in processed):
             logger.info('Processing builds')
-            self.builds_modified = False
-            for (module, module_config) in self.progress_bar(self.iter_global_modules()):
-                logger.debug('Processing using %s', module)
-                module.process(self.builds, module_config)
-
-        logger.info('Building')
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            with self.progress_bar(total=len(self.builds)) as build_progress_bar:
-                futures = [executor.submit(self.execute, build) for build in self.builds]
-                for future in concurrent.futures.as_completed(futures):
-                    e = future.exception()
-                    if e is not None:
-                        raise e
-                    build_progress_bar.update(1)
-
-        self.build_cache.cleanup()
-
-    def execute(self, build):
-        cached_build = self.build_cache.get(build)
-        if cached_build is not None:
+            for i, (module, module_config) in enumerate(self.progress_bar(global_modules)):
+                builds = self.builds[processed[i]:]
+                processed[i] = len(self.builds)
+                if builds:
+                    logger.debug('Processing %d builds using %s', len(builds), module)
+                    module.process(builds, module_config)
+        for (module, module_config) in global_modules:
+            module.finish(self.builds, module_config)
+
+    def run(self, changed_paths=None):
+        """This is the main function which should be executed to run a build.
+        The builder can be run many times, in that case the modules and the
+        templates loaded during the previous runs are reused.
+
+        changed_paths: paths relative to the source directory which changed
+                       since the last successful run. If this is not provided
+                       all files are considered to be changed.
+        """
+        with self.state:
+            self.running = True
+        try:
+            self.builds = []
+            self.sources.clear()
+            self.manifest = Manifest(self.config, self.source_directory,
+                                     self.output_directory, changed_paths,
+                                     self.sources, self.fingerprints,
+                                     self.outputs)
+            for module in self.module_cache.values():
+                module.reset()
+
+            logger.info('Scanning files')
+            self.add_builds(self.builds_generator())
+            self.check_cancelled()
+
+            self.process_builds()
+            self.check_cancelled()
+
+            logger.info('Building')
+            self.fingerprints.clear()
+            with self.create_executor() as executor:
+                with self.progress_bar(total=len(self.builds)) as build_progress_bar:
+                    scheduler = Scheduler(self, executor)
+                    with self.state:
+                        self.scheduler = scheduler
+                        if self.cancelled.is_set():
+                            scheduler.cancel()
+                        self.state.notify_all()
+                    for future in scheduler.run(self.builds):
+                        e = future.exception()
+                        if e is not None:
+                            raise e
+                        build_progress_bar.update(1)
+
+            if self.cancelled.is_set():
+                # Outputs of the builds which were not executed were left
+                # unchanged.
+                self.manifest.keep_previous()
+            else:
+                self.manifest.remove_stale_outputs()
+            self.manifest.save()
+            self.sources.save()
+            self.durations.save()
+            self.build_cache.cleanup()
+            self.check_cancelled()
+        finally:
+            with self.state:
+                self.running = False
+                self.scheduler = None
+                self.cancelled.clear()
+                self.state.notify_all()
+
+    def cancel(self):
+        """Stops the current run of the builder from another thread. Builds
+        which are being executed are allowed to finish and the remaining builds
+        are skipped, the run raises BuildCancelled. The outputs of the builds
+        executed so far are recorded in the manifest so they are not built
+        again by the next run.
+        """
+        with self.state:
+            if not self.running:
+                return
+            self.cancelled.set()
+            if self.scheduler is not None:
+                self.scheduler.cancel()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise BuildCancelled('Build cancelled.')
+
+    def prioritize(self, output_paths, timeout=None):
+        """Executes the builds creating the outputs before all other builds
+        if the builder is running and waits until they are executed. Called
+        by other threads, for example by the development server when a page
+        is requested.
+
+        Returns False if the builder is not running.
+
+        output_paths: paths relative to the output directory.
+        timeout: maximum time to wait in seconds.
+        """
+        with self.state:
+            self.state.wait_for(lambda: self.scheduler is not None or not self.running, timeout)
+            scheduler = self.scheduler
+        if scheduler is None:
+            return False
+        futures = [scheduler.prioritize(path) for path in output_paths]
+        concurrent.futures.wait([f for f in futures if f is not None], timeout)
+        return True
+
+    def execute(self, build, executor):
+        fingerprint = self.manifest.fingerprint(build, self.get_pipeline(build))
+        if self.manifest.is_up_to_date(build, fingerprint):
+            logger.debug('Up to date %s', build)
+            self.manifest.keep(build)
+            return
+
+        # Outputs are restored only if their dependencies are known so that
+        # they are recorded in the manifest like built ones.
+        cache_key = self.build_cache.get_key(build)
+        dependencies = self.build_cache.get_dependencies(cache_key)
+        if dependencies is not None and self.build_cache.restore(cache_key, build):
             logger.debug("Cached %s", build)
-            build.write(self.output_directory, cached_build)
+            build.dependencies = dependencies
+            self.manifest.record(build, fingerprint)
         else:
             logger.debug('Building %s', build)
+            start = time.perf_counter()
             try:
-                build.execute(self.config, self.source_directory, self.output_directory)
+                executor.run(build)
             except Exception as e:
                 raise Exception('error building: {}'.format(build)) from e
-            self.build_cache.put(build)
+            self.durations.record(build, time.perf_counter() - start,
+                                  self.sources.input_size(build))
+            self.build_cache.put(cache_key, build)
+            self.manifest.record(build, fingerprint)
+
+
+class WorkerBuilder(Builder):
+    """Builder used by the worker processes of a ProcessExecutor. It uses the
+    config of the main process and doesn't check the directories as the main
+    process already did that.
+    """
+
+    def __init__(self, source_directory, output_directory, config, outputs=None):
+        self.worker_config = config
+        super().__init__(source_directory, output_directory, outputs=outputs)
+
+    def test_directories(self):
+        pass
+
+    def get_config(self):
+        return self.worker_config
@@ -1,70 +1,593 @@
 import os
-import hashlib
-import pickle
-import appdirs
-import datetime
+import re
+import json
+import time
 import shutil
+import sqlite3
+import hashlib
+import tempfile
 import typing
+import threading
+import urllib.parse
+import urllib.error
+import urllib.request
+import appdirs
+from .config import output_config
+from .exceptions import BuildException
+from . import logging
+
+
+logger = logging.getLogger('cache')
+
+
+def cache_directory(*paths):
+    """Returns a path in the user cache directory."""
+    return os.path.join(appdirs.user_cache_dir("basilisk", "boreq"), *paths)
+
+
+class DirectoryRemoteCache(object):
+    """Remote cache stored in a directory shared by many machines, for example
+    mounted over NFS. Files are laid out the same way as in CacheStorage and
+    written to temporary files which are renamed. There is no index as sqlite
+    databases must not be shared over network filesystems, old entries have
+    to be removed by other means.
+
+    url: path to the directory or a file:// URL.
+    """
+
+    def __init__(self, url):
+        parsed = urllib.parse.urlparse(url)
+        self.directory = parsed.path if parsed.scheme == 'file' else url
+
+    def path(self, key: bytes) -> str:
+        h = key.hex()
+        return os.path.join(self.directory, h[:2], h[2:])
+
+    def get(self, key: bytes, target_path: str) -> bool:
+        """Copies the file stored under the key to the target path. Returns
+        False if the key is not present in the cache.
+        """
+        try:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            copy_file(self.path(key), target_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: bytes, file_path: str) -> None:
+        path = self.path(key)
+        if not os.path.exists(path):
+            atomic_write(path, lambda tmp_path: copy_file(file_path, tmp_path))
+
+
+class HTTPRemoteCache(object):
+    """Remote cache accessed over HTTP. Files are retrieved with
+    `GET <url>/<hex key>` and stored with `PUT <url>/<hex key>`, the server
+    should respond with 404 to requests for missing keys.
+
+    url: base URL of the cache.
+    """
+
+    # Timeout of a single request.
+    timeout = 30 # [seconds]
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def key_url(self, key: bytes) -> str:
+        return '%s/%s' % (self.url, key.hex())
+
+    def get(self, key: bytes, target_path: str) -> bool:
+        try:
+            response = urllib.request.urlopen(self.key_url(key), timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            raise
+        with response:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(target_path, 'wb') as f:
+                shutil.copyfileobj(response, f)
+        return True
+
+    def put(self, key: bytes, file_path: str) -> None:
+        with open(file_path, 'rb') as f:
+            request = urllib.request.Request(
+                self.key_url(key),
+                data=f,
+                method='PUT',
+                headers={
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Length': str(os.fstat(f.fileno()).st_size),
+                },
+            )
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+
 
 class Cache(object):
+    """Stores the outputs of the builds keyed by everything the output was
+    created from. The key has to be computed before the build is executed as
+    the processors may modify the additional context. Keys don't depend on the
+    location of the source directory so that a remote cache, configured using
+    the `remote_cache` config key, can be shared by many checkouts of the
+    project. Outputs missing from the local cache are retrieved from the
+    remote cache and new outputs are sent to it.
+
+    Example usage:
 
-    def __init__(self, config, source_directory, output_directory):
+        key = cache.get_key(build)
+        if not cache.restore(key, build):
+            build.execute(config, source_directory, output_directory)
+            cache.put(key, build)
+    """
+
+    def __init__(self, config, source_directory, output_directory, sources,
+                 fingerprints, outputs=None):
+        from .outputs import DirectoryOutputs
         self.config = config
+
+        # Config without the keys which don't affect the outputs.
+        self.output_config = output_config(config)
         self.source_directory = source_directory
         self.output_directory = output_directory
-        self.storage = CacheStorage()
+        if outputs is None:
+            outputs = DirectoryOutputs(output_directory)
+        self.outputs = outputs
+        self.sources = sources
+        self.fingerprints = fingerprints
+        self.storage = CacheStorage(cache_directory('outputs'),
+                                    config.get('cache_size', None))
+        self.remote = self.get_remote(config.get('remote_cache', None))
+        self.remote_readonly = config.get('remote_cache_readonly', False)
+
+    # Remote caches keyed by the scheme of the URL specified in the config.
+    remote_cache_classes = {
+        '': DirectoryRemoteCache,
+        'file': DirectoryRemoteCache,
+        'http': HTTPRemoteCache,
+        'https': HTTPRemoteCache,
+    }
+
+    def get_remote(self, url):
+        if url is None:
+            return None
+        scheme = urllib.parse.urlparse(url).scheme
+        if not scheme in self.remote_cache_classes:
+            raise BuildException('Unknown remote cache "%s".' % url)
+        return self.remote_cache_classes[scheme](url)
 
-    def get(self, build) -> typing.Optional[bytes]:
-        build_cache_key = self._get_key(build)
-        return self.storage.get(build_cache_key)
+    def disable_remote(self, e):
+        """Stops using the remote cache for the rest of the run as each
+        request would most likely fail the same way.
+        """
+        if self.remote is not None:
+            logger.warning('Remote cache disabled: %s', e)
+            self.remote = None
 
-    def put(self, build) -> None:
-        build_cache_key = self._get_key(build)
-        file_path = os.path.join(self.output_directory, build.output_path)
-        self.storage.put(build_cache_key, file_path)
+    def fetch(self, key: bytes) -> bool:
+        """Makes sure that the entry is present in the local cache by
+        retrieving it from the remote cache if needed. Returns False if the
+        entry is not present in either of them.
+        """
+        if os.path.isfile(self.storage.path(key)):
+            return True
+        remote = self.remote
+        if remote is None:
+            return False
+        try:
+            return self.storage.fetch(key, remote.get)
+        except OSError as e:
+            self.disable_remote(e)
+            return False
+
+    def restore(self, key: bytes, build) -> bool:
+        """Copies the cached output of the build to the outputs. Outputs
+        missing from the local cache are retrieved from the remote cache and
+        stored in the local cache first. Returns False if the output is not
+        present in the cache.
+        """
+        if not self.fetch(key):
+            return False
+        return self.storage.restore(key, self.outputs, build.output_path)
+
+    def get_dependencies(self, key: bytes) -> typing.Optional[set]:
+        """Returns the dependencies of the build recorded when its output was
+        put in the cache, see Build.dependencies, or None if they are not
+        known.
+        """
+        dependencies_key = self.get_dependencies_key(key)
+        if not self.fetch(dependencies_key):
+            return None
+        content = self.storage.read(dependencies_key)
+        if content is None:
+            return None
+        return {os.path.join(*path.split('/')) for path in json.loads(content)}
+
+    def put(self, key: bytes, build) -> None:
+        """Stores the output of the build and its dependencies."""
+        file_path = self.outputs.file_path(build.output_path)
+        if file_path is not None:
+            self.storage.put(key, file_path)
+        else:
+            self.storage.write(key, self.outputs.read(build.output_path))
+
+        # Paths use forward slashes so that the entries can be shared by
+        # machines running different systems.
+        dependencies_key = self.get_dependencies_key(key)
+        dependencies = sorted(path.replace(os.sep, '/') for path in build.dependencies)
+        self.storage.write(dependencies_key, json.dumps(dependencies).encode())
+
+        remote = self.remote
+        if remote is not None and not self.remote_readonly:
+            try:
+                remote.put(key, self.storage.path(key))
+                remote.put(dependencies_key, self.storage.path(dependencies_key))
+            except OSError as e:
+                self.disable_remote(e)
 
     def cleanup(self) -> None:
         self.storage.cleanup()
+        remove_legacy_entries(cache_directory())
+
+    def process(self, processor, content, context):
+        """Runs a processor of a build. Processors can define an attribute
+        `cache_identity` containing everything apart from the content which
+        affects their result, for example the options of a converter. Such
+        processors must not depend on the context and their results are
+        memoized using the digest of the content and the identity, so the
+        stages of a pipeline preceding a changed stage don't run again. Only
+        bytes and text are memoized.
+        """
+        identity = getattr(processor, 'cache_identity', None)
+        if identity is None or not isinstance(content, (bytes, str)):
+            return processor(content, context)
+        m = hashlib.sha256()
+        m.update(b'stage:text' if isinstance(content, str) else b'stage:bytes')
+        m.update(self.fingerprints.digest(identity))
+        data = content.encode() if isinstance(content, str) else content
+        m.update(hashlib.sha256(data).digest())
+        key = m.digest()
+
+        # The first byte of a stored result records its type.
+        stored = self.storage.read(key)
+        if stored is not None:
+            return stored[1:].decode() if stored[:1] == b't' else stored[1:]
+        result = processor(content, context)
+        if isinstance(result, str):
+            self.storage.write(key, b't' + result.encode())
+        elif isinstance(result, bytes):
+            self.storage.write(key, b'b' + result)
+        return result
 
-    def _get_key(self, build) -> bytes:
-        inpath = os.path.join(self.source_directory, build.input_path)
-        content = build.read(inpath)
+    def get_dependencies_key(self, key: bytes) -> bytes:
+        """Returns the key under which the dependencies of the output stored
+        under the key are stored.
+        """
+        return hashlib.sha256(b'dependencies:' + key).digest()
 
+    def get_key(self, build) -> bytes:
         m = hashlib.sha256()
-        m.update(inpath.encode('utf-8'))
-        m.update(content)
-        m.update(pickle.dumps(self.config))
-        m.update(pickle.dumps(build.additional_context))
+        m.update(build.input_path.replace(os.sep, '/').encode('utf-8'))
+        m.update(self.sources.digest(build))
+        m.update(self.fingerprints.digest(self.output_config))
+        m.update(self.fingerprints.digest_context(build.additional_context))
         return m.digest()
 
+
 class CacheStorage(object):
+    """Stores files keyed by digests. Files are placed in subdirectories named
+    after the first byte of the key so that no directory grows too large. The
+    size, last use and number of hits of each entry are kept in an sqlite
+    index, when the total size exceeds max_size the least recently used
+    entries are removed. Files are written to a temporary file and renamed so
+    that many processes can share the storage.
+
+    Example usage:
+
+        storage = CacheStorage(cache_directory('outputs'))
+        if not storage.materialize(key, path):
+            storage.put(key, path)
+        storage.cleanup()
+
+    directory: directory in which the files are stored.
+    max_size: maximum total size of the stored files, defaults to
+              CacheStorage.max_size.
+    """
+
+    max_size = 1024 * 1024 * 1024 # [bytes]
+
+    index_file_name = 'index.sqlite'
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        if max_size is not None:
+            self.max_size = max_size
+        self.lock = threading.Lock()
+
+        # Tuples (size, last_used, hits) which have to be saved in the index
+        # keyed by hex encoded keys.
+        self.used = {}
+
+    def path(self, key: bytes) -> str:
+        h = key.hex()
+        return os.path.join(self.directory, h[:2], h[2:])
+
+    def connect(self):
+        os.makedirs(self.directory, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(self.directory, self.index_file_name),
+                                     timeout=30)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, size INTEGER, last_used INTEGER, '
+            'hits INTEGER)'
+        )
+        return connection
+
+    def record_use(self, key: bytes, size: int, hits: int, last_used=None) -> None:
+        if last_used is None:
+            last_used = time.time_ns()
+        with self.lock:
+            _, previous_last_used, previous_hits = self.used.get(key.hex(), (None, 0, 0))
+            self.used[key.hex()] = (size, max(last_used, previous_last_used),
+                                    previous_hits + hits)
 
-    def __init__(self):
-        self.cache_directory = appdirs.user_cache_dir("basilisk", "boreq")
+    def materialize(self, key: bytes, target_path: str) -> bool:
+        """Copies the stored file to the target path. Returns False if the key
+        is not present in the storage.
+        """
+        try:
+            size = atomic_write(target_path, lambda tmp_path: copy_file(self.path(key), tmp_path))
+        except FileNotFoundError:
+            return False
+        self.record_use(key, size, 1)
+        return True
+
+    def restore(self, key: bytes, outputs, output_path) -> bool:
+        """Copies the stored file to the outputs, see materialize.
 
-    def get(self, h: bytes) -> typing.Optional[bytes]:
-        file_path = os.path.join(self.cache_directory, h.hex())
+        outputs: the backend storing the outputs, see DirectoryOutputs.
+        output_path: path relative to the output directory.
+        """
+        path = self.path(key)
         try:
-            with open(file_path, 'rb') as f:
-                now = self.utc_now()
-                os.utime(file_path, (now.timestamp(), now.timestamp()))
-                return f.read()
+            size = os.path.getsize(path)
+            # Entries can be removed when the storage is pruned so they must
+            # not be referenced.
+            outputs.copy(output_path, path, reference=False)
+        except FileNotFoundError:
+            return False
+        self.record_use(key, size, 1)
+        return True
+
+    def fetch(self, key: bytes, get) -> bool:
+        """Stores a file retrieved from elsewhere under the key. Returns False
+        if the file could not be retrieved.
+
+        get: a function which is passed the key and a target path and returns
+             False if the file doesn't exist, see DirectoryRemoteCache.get.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        os.close(fd)
+        try:
+            if not get(key, tmp_path):
+                return False
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.record_use(key, size, 0)
+        return True
+
+    def put(self, key: bytes, file_path: str) -> None:
+        """Stores a copy of the file under the key."""
+        size = atomic_write(self.path(key), lambda tmp_path: copy_file(file_path, tmp_path))
+        self.record_use(key, size, 0)
+
+    def read(self, key: bytes) -> typing.Optional[bytes]:
+        """Returns the content stored under the key or None."""
+        try:
+            with open(self.path(key), 'rb') as f:
+                content = f.read()
         except FileNotFoundError:
             return None
+        self.record_use(key, len(content), 1)
+        return content
+
+    def write(self, key: bytes, content: bytes) -> None:
+        """Stores the content under the key."""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+        atomic_write(self.path(key), write)
+        self.record_use(key, len(content), 0)
 
-    def put(self, h: bytes, file_path: str) -> None:
-        os.makedirs(self.cache_directory, exist_ok=True)
-        target_file_path = os.path.join(self.cache_directory, h.hex())
-        shutil.copyfile(file_path, target_file_path)
+    def take_used(self):
+        """Returns and forgets the usage of the entries recorded since the last
+        call. Used to pass the usage recorded by worker processes to the main
+        process, see add_used.
+        """
+        with self.lock:
+            used = self.used
+            self.used = {}
+        return used
+
+    def add_used(self, used):
+        for key, (size, last_used, hits) in used.items():
+            self.record_use(bytes.fromhex(key), size, hits, last_used)
+
+    def save(self) -> None:
+        """Saves the usage of the entries recorded since the last call to the
+        index.
+        """
+        used = self.take_used()
+        if not used:
+            return
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT INTO entries VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET size = excluded.size, '
+                    'last_used = MAX(last_used, excluded.last_used), '
+                    'hits = hits + excluded.hits',
+                    [(key, *entry) for key, entry in used.items()]
+                )
+        finally:
+            connection.close()
+
+    def prune(self, max_size=None):
+        """Removes the least recently used entries until the total size
+        doesn't exceed max_size. Returns a tuple containing the number of
+        removed entries and their total size.
+
+        max_size: defaults to the max_size of the storage.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        removed_entries = removed_size = 0
+        connection = self.connect()
+        try:
+            with connection:
+                total_size = connection.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM entries'
+                ).fetchone()[0]
+                if total_size <= max_size:
+                    return removed_entries, removed_size
+                rows = connection.execute(
+                    'SELECT key, size FROM entries ORDER BY last_used'
+                ).fetchall()
+                removed = []
+                for key, size in rows:
+                    if total_size <= max_size:
+                        break
+                    try:
+                        os.remove(self.path(bytes.fromhex(key)))
+                    except FileNotFoundError:
+                        pass
+                    removed.append((key,))
+                    total_size -= size
+                    removed_entries += 1
+                    removed_size += size
+                connection.executemany('DELETE FROM entries WHERE key = ?', removed)
+        finally:
+            connection.close()
+        return removed_entries, removed_size
+
+    def stats(self):
+        """Returns a dictionary describing the contents of the storage."""
+        self.save()
+        connection = self.connect()
+        try:
+            entries, size, hits = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) '
+                'FROM entries'
+            ).fetchone()
+        finally:
+            connection.close()
+        return {
+            'directory': self.directory,
+            'entries': entries,
+            'size': size,
+            'hits': hits,
+            'max_size': self.max_size,
+        }
 
     def cleanup(self) -> None:
-        for file_name in os.listdir(self.cache_directory):
-            file_path = os.path.join(self.cache_directory, file_name)
-            statinfo = os.stat(file_path)
-            v = datetime.datetime.utcfromtimestamp(statinfo.st_atime)
-            now = self.utc_now()
-            if abs((v - now).total_seconds()) > 60 * 60:
-                os.remove(file_path)
-
-    def utc_now(self) -> datetime.datetime:
-        return datetime.datetime.utcnow()
+        """Saves the index and removes entries exceeding the size limit,
+        called at the end of every run.
+        """
+        self.save()
+        self.prune()
+
+
+# Names of the entries stored directly in the cache directory by previous
+# versions, hex encoded SHA-256 digests.
+legacy_entry_name = re.compile(r'[0-9a-f]{64}')
+
+# Name of the file created in the cache directory once the legacy entries
+# were removed.
+legacy_marker_name = '.legacy-entries-removed'
+
+
+def remove_legacy_entries(directory):
+    """Removes the entries stored directly in the cache directory by previous
+    versions, which are no longer used or cleaned up. This is done only once
+    for each cache directory.
+    """
+    marker_path = os.path.join(directory, legacy_marker_name)
+    if os.path.exists(marker_path):
+        return
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if legacy_entry_name.fullmatch(name) and os.path.isfile(path):
+            logger.debug('Removing legacy cache entry %s', name)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    with open(marker_path, 'w'):
+        pass
+
+
+def atomic_write(path, write):
+    """Creates a file by writing to a temporary file in the same directory and
+    renaming it so that other processes never observe a partially written
+    file. Returns the value returned by write.
+
+    write: a function which is passed a path to the temporary file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    os.close(fd)
+    try:
+        result = write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return result
+
+
+# Request code of the FICLONE ioctl which makes a file share the blocks of
+# another file on filesystems supporting copy-on-write.
+FICLONE = 0x40049409
+
+
+def copy_file(source_path, target_path) -> int:
+    """Copies the contents of a file without reading them into memory. The
+    blocks of the source file are shared with the copy if the filesystem
+    supports it, otherwise the data is copied by the kernel. Returns the size
+    of the file.
+    """
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        size = os.fstat(source.fileno()).st_size
+        try:
+            import fcntl
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return size
+        except (ImportError, OSError):
+            pass
+        if hasattr(os, 'copy_file_range'):
+            try:
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(source.fileno(), target.fileno(), size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                if copied == size:
+                    return size
+            except OSError:
+                pass
+            source.seek(0)
+            target.seek(0)
+            target.truncate()
+        shutil.copyfileobj(source, target)
+        return size
@@ -1,6 +1,7 @@
 import click
 import logging
 from .builder import Builder
+from .cache import CacheStorage, cache_directory
 from .server import Server
 from .helpers import import_by_name
 from . import logging as basilisklogging
@@ -30,11 +31,20 @@ def cli(ctx, debug):
 @click.argument('source_directory', type=click.Path(exists=False, resolve_path=True))
 @click.argument('output_directory', type=click.Path(resolve_path=True))
 @click.option('--progress/--no-progress', default=False)
+@click.option('--executor', type=click.Choice(sorted(Builder.executor_classes)),
+              help='Overrides the executor defined in the config.')
+@click.option('--jobs', type=click.IntRange(min=1),
+              help='Maximum number of builds executed at the same time.')
+@click.option('--trust-mtime/--no-trust-mtime', default=None,
+              help='Consider input files unchanged if their size and '
+                   'modification time are the same instead of hashing them.')
 @click.pass_context
-def build(ctx, source_directory, output_directory, progress):
+def build(ctx, source_directory, output_directory, progress, executor, jobs,
+          trust_mtime):
     """Builds your website into the output directory."""
     try:
-        builder = Builder(source_directory, output_directory, progress=progress)
+        builder = Builder(source_directory, output_directory, progress=progress,
+                          executor=executor, jobs=jobs, trust_mtime=trust_mtime)
         builder.run()
     except Exception as e:
         logger.critical(e)
@@ -48,7 +58,10 @@ def build(ctx, source_directory, output_directory, progress):
 @click.option('--host', type=str)
 @click.option('--port', type=int)
 @click.option('--progress/--no-progress', default=False)
-def serve(ctx, source_directory, host, port, progress):
+@click.option('--in-memory/--on-disk', default=True,
+              help='Hold the built files in memory instead of writing them '
+                   'to a temporary directory.')
+def serve(ctx, source_directory, host, port, progress, in_memory):
     """Builds and serves your website, rebuilding on file changes."""
     kwargs = {}
     if host is not None:
@@ -56,7 +69,8 @@ def serve(ctx, source_directory, host, port, progress):
     if port is not None:
         kwargs['port'] = port
     try:
-        server = Server(source_directory, progress=progress, **kwargs)
+        server = Server(source_directory, progress=progress, in_memory=in_memory,
+                        **kwargs)
         server.run()
     except Exception as e:
         logger.critical(e)
@@ -64,6 +78,39 @@ def serve(ctx, source_directory, host, port, progress):
             raise
 
 
+@cli.group()
+def cache():
+    """Manages the cache of built files."""
+
+
+@cache.command()
+@click.argument('source_directory', required=False,
+                type=click.Path(exists=True, file_okay=False, resolve_path=True))
+def stats(source_directory):
+    """Displays the size of the cache. If the source directory of a project
+    is given the maximum size is taken from its config.
+    """
+    max_size = None
+    if source_directory is not None:
+        max_size = Builder.load_config(source_directory).get('cache_size', None)
+    stats = CacheStorage(cache_directory('outputs'), max_size).stats()
+    print('Directory: {directory}'.format(**stats))
+    print('Entries: {entries}'.format(**stats))
+    print('Size: {size} bytes'.format(**stats))
+    print('Maximum size: {max_size} bytes'.format(**stats))
+    print('Hits: {hits}'.format(**stats))
+
+
+@cache.command()
+@click.option('--max-size', type=click.IntRange(min=0),
+              help='Size of the cache in bytes after pruning, 0 removes all entries.')
+def prune(max_size):
+    """Removes the least recently used entries from the cache."""
+    storage = CacheStorage(cache_directory('outputs'))
+    entries, size = storage.prune(max_size)
+    print('Removed {} entries, {} bytes.'.format(entries, size))
+
+
 @cli.command()
 @click.argument('module_name')
 def show_help(module_name):
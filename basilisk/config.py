@@ -13,3 +13,31 @@ class Config(dict):
     def from_json_file(self, file_path):
         with open(file_path, 'r') as f:
             self.update(json.load(f))
+
+
+# Config keys which only affect how the builds are executed and not what the
+# outputs contain. They are left out of the cache keys and the fingerprints so
+# that, for example, changing the number of jobs doesn't rebuild the website.
+execution_keys = frozenset([
+    'executor',
+    'jobs',
+    'cache_size',
+    'remote_cache',
+    'remote_cache_readonly',
+    'trust_mtime',
+    'memory_budget',
+    'module_jobs',
+])
+
+# Pipeline keys which only affect how the builds are executed, see
+# execution_keys.
+pipeline_execution_keys = frozenset(['jobs'])
+
+
+def output_config(config, keys=execution_keys):
+    """Returns a copy of the config without the keys which don't affect the
+    outputs.
+
+    keys: keys which should be left out.
+    """
+    return {key: value for key, value in config.items() if not key in keys}
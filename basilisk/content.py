@@ -0,0 +1,80 @@
+import functools
+
+
+class Content(object):
+    """Carries the content of a build between the processors. The content can
+    be represented as bytes, text or a parsed HTML document (a BeautifulSoup
+    object) and is converted only when a processor needs a different
+    representation than the one returned by the previous processor.
+    Processors declare the representation they accept using an attribute
+    `content_type` which defaults to "bytes", see text_processor.
+
+    Example usage:
+
+        content = Content(b'<p>Text</p>')
+        text = content.get('text')
+        dom = content.get('dom')
+
+    value: bytes, a memoryview of bytes, str or a BeautifulSoup object.
+    """
+
+    content_types = ['bytes', 'text', 'dom']
+
+    def __init__(self, value):
+        # Representations of the content keyed by content types.
+        self.representations = {self.get_content_type(value): value}
+
+    @staticmethod
+    def get_content_type(value):
+        if isinstance(value, (bytes, memoryview)):
+            return 'bytes'
+        if isinstance(value, str):
+            return 'text'
+        import bs4
+        if isinstance(value, bs4.BeautifulSoup):
+            return 'dom'
+        raise TypeError('unsupported content %r' % type(value))
+
+    def get(self, content_type):
+        """Returns the content converted to the requested representation.
+
+        content_type: "bytes", "text" or "dom".
+        """
+        if content_type in self.representations:
+            value = self.representations[content_type]
+            if isinstance(value, memoryview):
+                value = value.tobytes()
+        elif content_type == 'bytes':
+            value = self.get('text').encode()
+        elif content_type == 'text':
+            if 'dom' in self.representations:
+                value = str(self.representations['dom'])
+            else:
+                value = str(self.representations['bytes'], 'utf-8')
+        elif content_type == 'dom':
+            import bs4
+            value = bs4.BeautifulSoup(self.get('text'), features='html.parser')
+        else:
+            raise ValueError('unknown content type %r' % content_type)
+
+        # The document can be modified in place so other representations may
+        # no longer be valid.
+        if content_type == 'dom':
+            self.representations = {}
+        self.representations[content_type] = value
+        return value
+
+
+def text_processor(f):
+    """Decorates a processor which accepts and returns text so that the
+    build passes it text instead of bytes. Called directly with bytes the
+    processor decodes them and encodes the result, which is how all processors
+    worked before content types were introduced.
+    """
+    @functools.wraps(f)
+    def processor(content, *args, **kwargs):
+        if isinstance(content, bytes):
+            return f(content.decode(), *args, **kwargs).encode()
+        return f(content, *args, **kwargs)
+    processor.content_type = 'text'
+    return processor
@@ -0,0 +1,92 @@
+import bs4
+
+
+class HtmlDocument(object):
+    """A parsed HTML document passed to the visitors of an HtmlStage.
+
+    soup: the parsed document.
+    context: context passed to the processor.
+    """
+
+    def __init__(self, soup, context):
+        self.soup = soup
+        self.context = context
+
+        # Set by the visitors if the document has to be serialized again,
+        # otherwise the original content is returned.
+        self.modified = False
+
+        # Set by the visitors if the document should be serialized using
+        # BeautifulSoup.prettify.
+        self.pretty = False
+
+
+class HtmlVisitor(object):
+    """Base class of the visitors registered with an HtmlStage. Visitors
+    rewrite the document in place, each of the methods is called once per
+    execution of the stage.
+    """
+
+    def start(self, document):
+        """Called before the document is walked."""
+        pass
+
+    def visit(self, tag, document):
+        """Called for every tag of the document in document order."""
+        pass
+
+    def finish(self, document):
+        """Called after the document was walked."""
+        pass
+
+
+class HtmlStage(object):
+    """A processor which parses the content as HTML once and walks the tree
+    once calling all registered visitors for each tag. Modules rewriting HTML
+    register visitors using get_html_stage so that consecutive modules in a
+    pipeline share a single stage. A modified document is returned without
+    serializing it, see Content.
+
+    Only modules which directly follow each other in a pipeline share a
+    stage. A processor working on text or bytes, for example the one added by
+    minify_html, placed between two such modules makes the document be
+    serialized and parsed again. Such modules should be placed after all
+    modules rewriting HTML so that the document is serialized only once.
+    """
+
+    content_type = 'text'
+
+    def __init__(self):
+        self.visitors = []
+
+    def add_visitor(self, visitor):
+        self.visitors.append(visitor)
+
+    def __call__(self, content, context=None):
+        if isinstance(content, bytes):
+            content = content.decode()
+        soup = bs4.BeautifulSoup(content, features='html.parser')
+        document = HtmlDocument(soup, context)
+        for visitor in self.visitors:
+            visitor.start(document)
+        for tag in soup.find_all(True):
+            for visitor in self.visitors:
+                visitor.visit(tag, document)
+        for visitor in self.visitors:
+            visitor.finish(document)
+        if not document.modified:
+            return content
+        if document.pretty:
+            return soup.prettify()
+        return soup
+
+
+def get_html_stage(build):
+    """Returns the HtmlStage which is the last processor of the build,
+    appending a new one if the last processor is not an HtmlStage.
+    """
+    if build.processors and isinstance(build.processors[-1], HtmlStage):
+        return build.processors[-1]
+    stage = HtmlStage()
+    build.processors.append(stage)
+    return stage
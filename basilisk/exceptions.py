@@ -4,3 +4,7 @@ class BuildException(Exception):
 
 class TemplateRenderException(BuildException):
     pass
+
+
+class BuildCancelled(BuildException):
+    pass
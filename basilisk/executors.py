@@ -0,0 +1,205 @@
+import io
+import os
+import pickle
+import traceback
+import concurrent.futures
+from .exceptions import BuildException
+from . import logging
+
+
+logger = logging.getLogger('executors')
+
+
+class ThreadExecutor(object):
+    """Executes builds in a pool of threads. This is the default executor.
+    Since most of the processors hold the GIL it is best suited for small
+    websites or pipelines which spend their time in external programs.
+
+    Example usage:
+
+        with ThreadExecutor(builder, jobs) as executor:
+            future = executor.submit(build)
+
+    builder: a Builder object.
+    jobs: maximum number of builds executed at the same time, defaults to the
+          value picked by concurrent.futures.
+    """
+
+    def __init__(self, builder, jobs=None):
+        self.builder = builder
+        self.jobs = jobs
+        self.pool = None
+
+    @property
+    def workers(self):
+        """Number of builds which can be executed at the same time."""
+        return self.jobs or min(32, (os.cpu_count() or 1) + 4)
+
+    def __enter__(self):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *args):
+        self.pool.shutdown()
+        self.pool = None
+
+    def submit(self, build):
+        """Schedules a build for execution and returns a future."""
+        return self.pool.submit(self.builder.execute, build, self)
+
+    def run(self, build):
+        """Runs a build which was not found in the cache."""
+        build.execute(self.builder.config, self.builder.source_directory,
+                      self.builder.output_directory, self.builder.sources,
+                      self.builder.build_cache, self.builder.outputs)
+
+
+class ProcessExecutor(ThreadExecutor):
+    """Executes builds in a pool of processes so that CPU bound pipelines can
+    use all available cores. Processors can't be sent to other processes, so
+    instead a description of the build is sent to the worker which executes the
+    pipeline modules again to recreate them. Objects which are shared between
+    many builds, for example listings and pipelines, are sent to each worker
+    only once. The main process still checks and populates the cache, the
+    workers only send back the output path, the dependencies of the build and
+    the usage of the memoized processor results. Outputs which are not stored
+    in the output directory are sent back as well, see MemoryOutputs.
+    """
+
+    @property
+    def workers(self):
+        return self.jobs or os.cpu_count() or 1
+
+    def __enter__(self):
+        super().__enter__()
+        shared = find_shared_objects(self.builder.builds)
+        for pipeline in self.builder.pipelines.pipelines:
+            shared[id(pipeline)] = pipeline
+        initargs = (
+            self.builder.source_directory,
+            self.builder.output_directory,
+            self.builder.config,
+            list(shared.values()),
+            self.builder.outputs,
+        )
+        self.shared_ids = {k: i for i, k in enumerate(shared)}
+        self.processes = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_worker,
+            initargs=initargs,
+        )
+        return self
+
+    def __exit__(self, *args):
+        self.processes.shutdown()
+        self.processes = None
+        super().__exit__(*args)
+
+    def describe(self, build):
+        """Returns a picklable description of the build."""
+        pipeline = self.builder.get_pipeline(build)
+        f = io.BytesIO()
+        pickler = SharedObjectsPickler(f, self.shared_ids)
+        pickler.dump((build, pipeline))
+        return f.getvalue()
+
+    def run(self, build):
+        description = self.describe(build)
+        future = self.processes.submit(execute_in_worker, description)
+        result = future.result()
+        build.output_path = result['output_path']
+        build.dependencies = set(result['dependencies'])
+        self.builder.build_cache.storage.add_used(result['cache_used'])
+        if result['output'] is not None:
+            self.builder.outputs.add(build.output_path, result['output'])
+
+
+def find_shared_objects(builds):
+    """Returns a dictionary of dictionaries, lists and objects defining
+    `__fingerprint__` (such as listings, see Fingerprinter) which are
+    referenced by more than one build, keyed by their ids. Each object is
+    scanned only once so the cost is linear in the size of all unique objects.
+    The contents of objects other than dictionaries and lists are not scanned.
+    """
+    seen = set()
+    shared = {}
+    for build in builds:
+        stack = [v for k, v in vars(build).items() if k != 'processors']
+        while stack:
+            value = stack.pop()
+            if not isinstance(value, (dict, list)) and not hasattr(value, '__fingerprint__'):
+                continue
+            key = id(value)
+            if key in seen:
+                shared[key] = value
+                continue
+            seen.add(key)
+            if isinstance(value, dict):
+                stack.extend(value.values())
+            elif isinstance(value, list):
+                stack.extend(value)
+    return shared
+
+
+class SharedObjectsPickler(pickle.Pickler):
+    """Replaces shared objects with references to the objects which were sent
+    to the worker when it was started.
+
+    shared_ids: a dictionary mapping ids of objects to their references.
+    """
+
+    def __init__(self, f, shared_ids):
+        super().__init__(f)
+        self.shared_ids = shared_ids
+
+    def persistent_id(self, obj):
+        return self.shared_ids.get(id(obj), None)
+
+
+class SharedObjectsUnpickler(pickle.Unpickler):
+
+    def __init__(self, f, shared):
+        super().__init__(f)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+
+# State of the worker process, see init_worker.
+_worker: dict = {}
+
+
+def init_worker(source_directory, output_directory, config, shared, outputs):
+    """Sets up a worker process of a ProcessExecutor."""
+    from .builder import WorkerBuilder
+    _worker['builder'] = WorkerBuilder(source_directory, output_directory, config,
+                                       outputs)
+    _worker['shared'] = shared
+
+
+def execute_in_worker(description):
+    """Recreates a build from its description and executes it. Exceptions
+    are converted to BuildException containing the formatted traceback as they
+    may not be picklable.
+    """
+    builder = _worker['builder']
+    f = io.BytesIO(description)
+    build, pipeline = SharedObjectsUnpickler(f, _worker['shared']).load()
+    try:
+        output_path = build.output_path
+        build.output_path = build.initial_output_path
+        builder.apply_pipeline(build, pipeline)
+        if build.output_path != output_path:
+            logger.warning('Output path of %s differs from the main process', build)
+        build.execute(builder.config, builder.source_directory,
+                      builder.output_directory, builder.sources,
+                      builder.build_cache, builder.outputs)
+    except Exception:
+        raise BuildException(traceback.format_exc())
+    return {
+        'output_path': build.output_path,
+        'dependencies': list(build.dependencies),
+        'cache_used': builder.build_cache.storage.take_used(),
+        'output': builder.outputs.take(build.output_path),
+    }
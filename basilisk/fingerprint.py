@@ -0,0 +1,105 @@
+import pickle
+import hashlib
+import threading
+
+
+class Fingerprinter(object):
+    """Computes SHA-256 digests of the config and of the objects placed in the
+    additional context of the builds. The digests of dictionaries, lists and
+    tuples are remembered by identity so that objects shared by many builds,
+    such as listings, are hashed only once and the total cost is linear in the
+    size of the website. Because of that the objects must not be modified
+    until the fingerprinter is cleared.
+
+    Objects can define a method `__fingerprint__` returning bytes which should
+    be hashed instead of their contents. Objects of unknown types are pickled.
+
+    Example usage:
+
+        fingerprints = Fingerprinter()
+        config_digest = fingerprints.digest(config)
+        context_digest = fingerprints.digest_context(build.additional_context)
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """Forgets all remembered digests, called before executing builds."""
+        with self.lock:
+            # Tuples (object, digest) keyed by object ids. The object is kept so
+            # that the id can't be reused.
+            self.memo = {}
+
+    def digest(self, obj) -> bytes:
+        """Returns a digest of the object."""
+        with self.lock:
+            return self._digest(obj)
+
+    def digest_context(self, context, exclude=()) -> bytes:
+        """Returns a digest of a context dictionary. Unlike digest the result
+        doesn't depend on the order of the keys and is not remembered as each
+        build has its own context.
+
+        exclude: keys which should be skipped.
+        """
+        with self.lock:
+            m = hashlib.sha256()
+            for key in sorted(context):
+                if not key in exclude:
+                    self._update(m, key)
+                    self._update_child(m, context[key])
+            return m.digest()
+
+    def _is_remembered(self, obj):
+        return isinstance(obj, (dict, list, tuple)) or hasattr(obj, '__fingerprint__')
+
+    def _digest(self, obj):
+        key = id(obj)
+        if key in self.memo:
+            return self.memo[key][1]
+        m = hashlib.sha256()
+        self._update(m, obj)
+        digest = m.digest()
+        if self._is_remembered(obj):
+            self.memo[key] = (obj, digest)
+        return digest
+
+    def _update_child(self, m, obj):
+        if self._is_remembered(obj):
+            m.update(b'c')
+            m.update(self._digest(obj))
+        else:
+            self._update(m, obj)
+
+    def _update(self, m, obj):
+        if obj is None:
+            m.update(b'n')
+        elif isinstance(obj, bool):
+            m.update(b't' if obj else b'f')
+        elif isinstance(obj, (int, float)):
+            m.update(b'i%r;' % obj)
+        elif isinstance(obj, str):
+            data = obj.encode('utf-8', 'surrogatepass')
+            m.update(b's%d:' % len(data))
+            m.update(data)
+        elif isinstance(obj, bytes):
+            m.update(b'b%d:' % len(obj))
+            m.update(obj)
+        elif hasattr(obj, '__fingerprint__'):
+            m.update(b'o')
+            m.update(obj.__fingerprint__())
+        elif isinstance(obj, dict):
+            m.update(b'd%d:' % len(obj))
+            for key, value in obj.items():
+                self._update_child(m, key)
+                self._update_child(m, value)
+        elif isinstance(obj, (list, tuple)):
+            m.update(b'l%d:' % len(obj))
+            for value in obj:
+                self._update_child(m, value)
+        else:
+            data = pickle.dumps(obj)
+            m.update(b'p%d:' % len(data))
+            m.update(data)
@@ -0,0 +1,73 @@
+import codecs
+import re
+
+
+# Line boundaries recognized by str.splitlines encoded in UTF-8.
+line_boundary = re.compile(rb'\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]')
+
+
+# Size of the chunks in which is_text validates the content.
+chunk_size = 64 * 1024
+
+
+def is_text(content: bytes, position: int = 0) -> bool:
+    """Returns True if the content located at the given position and after it
+    is valid UTF-8. The content is validated in chunks so that it is never
+    decoded as a whole.
+    """
+    view = memoryview(content)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for start in range(position, len(content), chunk_size):
+            decoder.decode(view[start:start + chunk_size])
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def split_lines(content: bytes, position: int):
+    """Yields tuples (start, end) of lines located at the given position and
+    after it. The end includes the line boundary.
+    """
+    while position < len(content):
+        match = line_boundary.search(content, position)
+        end = match.end() if match else len(content)
+        yield position, end
+        position = end
+
+
+def parse(content: bytes, read_parameter):
+    """Splits the content into the body and the parameters defined at the top
+    of the content, see Build.extract_parameters. Only the lines containing
+    the parameters are decoded and the body is returned as a memoryview of
+    the content so that it is not copied. The content which is not valid
+    UTF-8 is returned unchanged, the body is validated only if the result
+    depends on it, that is if it is preceded by parameters or an empty line.
+
+    read_parameter: a function which is passed a line of text and returns a
+                    dictionary with the parameter defined on it or an empty
+                    dictionary if the line doesn't define a parameter.
+    """
+    parameters = {}
+    body = len(content)
+    for start, end in split_lines(content, 0):
+        try:
+            line = content[start:end].decode()
+        except UnicodeDecodeError:
+            return content, {}
+        parameter = read_parameter(line)
+        if not parameter:
+            body = start
+            break
+        parameters.update(parameter)
+
+    if content.startswith(b'\r\n', body):
+        empty_line = 2
+    elif content.startswith(b'\n', body):
+        empty_line = 1
+    else:
+        empty_line = 0
+    if (parameters or empty_line) and not is_text(content, body):
+        return content, {}
+    return memoryview(content)[body + empty_line:], parameters
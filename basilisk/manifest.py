@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import hashlib
+from .cache import cache_directory
+from .config import output_config, pipeline_execution_keys
+from .fingerprint import Fingerprinter
+from .outputs import DirectoryOutputs
+from . import logging
+
+
+logger = logging.getLogger('manifest')
+
+
+class Manifest(object):
+    """Manifest records what each output file created during the last run was
+    built from: the input file, the config, the additional context created by
+    the modules and other files such as templates (see Build.dependencies).
+    During the next run builds whose recorded fingerprint and dependencies did
+    not change are skipped as their outputs are already present in the output
+    directory. The manifest is stored in the cache directory under a name
+    derived from the absolute path of the output directory, so that it is not
+    published together with the website.
+
+    Example usage:
+
+        manifest = Manifest(config, source_directory, output_directory)
+        fingerprint = manifest.fingerprint(build, pipeline)
+        if not manifest.is_up_to_date(build, fingerprint):
+            build.execute(config, source_directory, output_directory)
+            manifest.record(build, fingerprint)
+        manifest.save()
+
+    config: a Config object.
+    source_directory: root directory of the project.
+    output_directory: output directory.
+    changed_paths: paths relative to the source directory which changed since
+                   the manifest was saved. If this is provided digests of the
+                   files which didn't change are taken from the manifest
+                   instead of reading the files again.
+    sources: a SourceStore used to read the builds.
+    fingerprints: a Fingerprinter used to compute digests of the config and
+                  the context.
+    outputs: the backend storing the outputs, defaults to the files in the
+             output directory, see DirectoryOutputs.
+
+    If the `trust_mtime` config key is set the size and modification time of
+    the input files are recorded as well and input files which have the same
+    size and modification time are not hashed again. This only affects this
+    check, the keys of the cache are always computed from the contents of the
+    files.
+    """
+
+    version = 1
+
+    # Modification times of input files modified more recently than this are
+    # not recorded as they could be modified again without changing their
+    # modification time.
+    min_age = 2 * 10**9 # [nanoseconds]
+
+    # Context keys which are not included in the fingerprint. Templates add a
+    # list of all templates and their modification times to the context but
+    # the templates which were actually used are tracked as dependencies.
+    untracked_context_keys = ['templates']
+
+    def __init__(self, config, source_directory, output_directory,
+                 changed_paths=None, sources=None, fingerprints=None,
+                 outputs=None):
+        self.config = config
+        self.source_directory = source_directory
+        self.output_directory = output_directory
+        self.outputs = outputs or DirectoryOutputs(output_directory)
+        self.changed_paths = changed_paths
+        self.sources = sources
+        self.fingerprints = fingerprints or Fingerprinter()
+        self.trust_mtime = config.get('trust_mtime', False)
+
+        # Config and pipelines without the keys which don't affect the
+        # outputs, the pipelines are keyed by their ids.
+        self.output_config = output_config(config)
+        self.output_pipelines = {}
+
+        # Records loaded from the manifest created during the last run.
+        self.previous = self.load()
+
+        # Records of the current run keyed by output paths.
+        self.current = {}
+
+        # Digests of dependencies computed during this run keyed by paths.
+        self.digests = {}
+
+    @classmethod
+    def get_path(cls, output_directory):
+        digest = hashlib.sha256(os.path.abspath(output_directory).encode('utf-8')).hexdigest()
+        return cache_directory('manifests', digest + '.json')
+
+    @classmethod
+    def exists(cls, output_directory):
+        """Returns True if the output directory contains outputs of a previous
+        run.
+        """
+        return os.path.isfile(cls.get_path(output_directory))
+
+    @classmethod
+    def remove(cls, output_directory):
+        """Removes the manifest of an output directory which won't be used
+        again.
+        """
+        try:
+            os.remove(cls.get_path(output_directory))
+        except FileNotFoundError:
+            pass
+
+    @property
+    def path(self):
+        return self.get_path(self.output_directory)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning('Manifest is corrupted, rebuilding everything.')
+            return {}
+        if data.get('version') != self.version:
+            return {}
+        return data['outputs']
+
+    def save(self):
+        """Atomically replaces the manifest with the records of this run."""
+        data = {
+            'version': self.version,
+            'outputs': self.current,
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def digest(self, data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def is_changed(self, path):
+        """Returns True if the file or any of the directories containing it
+        may have changed since the manifest was saved.
+        """
+        if self.changed_paths is None:
+            return True
+        while path:
+            if path in self.changed_paths:
+                return True
+            path = os.path.dirname(path)
+        return False
+
+    def is_tree_changed(self, directory):
+        """Returns True if the directory or any of the files located in it may
+        have changed since the manifest was saved.
+
+        directory: path relative to the source directory.
+        """
+        if self.is_changed(directory):
+            return True
+        prefix = os.path.join(directory, '')
+        return any(path.startswith(prefix) for path in self.changed_paths)
+
+    def digest_file(self, path, recorded=None):
+        """Returns a digest of a file relative to the source directory or None
+        if it doesn't exist.
+
+        recorded: a dictionary with digests recorded in the manifest which will
+                  be used if the file didn't change.
+        """
+        if recorded is not None and path in recorded and not self.is_changed(path):
+            return recorded[path]
+        return self._digest_file(path)
+
+    def _digest_file(self, path):
+        """Reads and hashes the file, the result is remembered until the end
+        of the run.
+        """
+        if not path in self.digests:
+            try:
+                with open(os.path.join(self.source_directory, path), 'rb') as f:
+                    self.digests[path] = self.digest(f.read())
+            except FileNotFoundError:
+                self.digests[path] = None
+        return self.digests[path]
+
+    def fingerprint(self, build, pipeline):
+        """Returns a fingerprint of everything that is known about the build
+        before it is executed.
+
+        pipeline: the pipeline used to create the build.
+        """
+        config = self.fingerprints.digest(self.output_config) \
+            + self.fingerprints.digest(self.get_output_pipeline(pipeline))
+        context = self.fingerprints.digest_context(build.additional_context,
+                                                   self.untracked_context_keys)
+        return {
+            'input_path': build.input_path,
+            'input': self.digest_input(build),
+            'config': self.digest(config),
+            'context': context.hex(),
+        }
+
+    def get_output_pipeline(self, pipeline):
+        if pipeline is None:
+            return None
+        if not id(pipeline) in self.output_pipelines:
+            self.output_pipelines[id(pipeline)] = (
+                pipeline, output_config(pipeline, pipeline_execution_keys)
+            )
+        return self.output_pipelines[id(pipeline)][1]
+
+    def input_stat(self, build):
+        """Returns a list containing the size and modification time of the
+        input file of the build.
+        """
+        if self.sources is not None:
+            stat = self.sources.stat(build)
+        else:
+            stat = os.stat(os.path.join(self.source_directory, build.input_path))
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def digest_input(self, build):
+        record = self.previous.get(build.output_path, None)
+        if record is not None and record['input_path'] == build.input_path \
+                and build.reads_input_file():
+            if not self.is_changed(build.input_path):
+                return record['input']
+            if self.trust_mtime and record.get('input_stat') == self.input_stat(build):
+                return record['input']
+        if self.sources is not None:
+            return self.sources.digest(build).hex()
+        inpath = os.path.join(self.source_directory, build.input_path)
+        return self.digest(build.read(inpath))
+
+    def is_up_to_date(self, build, fingerprint):
+        """Returns True if the output of the build recorded during the last run
+        is present and none of the things it was created from changed.
+        """
+        record = self.previous.get(build.output_path, None)
+        if record is None or record['dependencies'] is None:
+            return False
+        for key, value in fingerprint.items():
+            if record[key] != value:
+                return False
+        for path, digest in record['dependencies'].items():
+            if self.digest_file(path, record['dependencies']) != digest:
+                return False
+        return self.outputs.exists(build.output_path)
+
+    def keep(self, build):
+        """Carries over the record of a build which was up to date."""
+        self.current[build.output_path] = self.previous[build.output_path]
+
+    def record(self, build, fingerprint, dependencies=True):
+        """Records a build which was executed.
+
+        dependencies: False if Build.dependencies are not known, for example
+                      because the output was retrieved from a cache entry
+                      stored without them, see Cache.put. Such
+                      builds will be considered out of date during the next
+                      run.
+        """
+        record = dict(fingerprint)
+        if self.trust_mtime and build.reads_input_file():
+            stat = self.input_stat(build)
+            if time.time_ns() - stat[1] >= self.min_age:
+                record['input_stat'] = stat
+        if dependencies:
+            record['dependencies'] = {p: self.digest_file(p) for p in build.dependencies}
+        else:
+            record['dependencies'] = None
+        self.current[build.output_path] = record
+
+    def keep_previous(self):
+        """Carries over the records of all builds which were not executed or
+        kept during this run, used if the run was cancelled as their outputs
+        were left unchanged.
+        """
+        for output_path, record in self.previous.items():
+            self.current.setdefault(output_path, record)
+
+    def remove_stale_outputs(self):
+        """Removes outputs created during the last run which were not created
+        during this run, for example because their source files were deleted.
+        """
+        for output_path in self.previous:
+            if output_path in self.current:
+                continue
+            logger.debug('Removing stale output %s', output_path)
+            self.outputs.remove(output_path)
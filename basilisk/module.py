@@ -50,16 +50,34 @@ class Module(object):
 
         raise KeyError
 
+    def reset(self):
+        """Called at the beginning of every run of the builder as the same
+        module is used for many runs in the development server. Modules which
+        keep state between the calls to process should clear it here.
+        """
+        pass
+
     def process(self, builds, module_config):
         """Process builds using this module. This method can be called multiple
-        times so modules which create builds should make sure that each of them
-        is created only once.
+        times during a single run as modules can create new builds. Each call
+        receives only the builds which were added since the previous call,
+        including the builds created by this module, so modules which need all
+        builds should collect them and clear them in reset.
 
-        builds: iterator returning Build objects.
+        builds: a list of Build objects added since the previous call.
         module_config: a dictionary witht the module config.
         """
         pass
 
+    def finish(self, builds, module_config):
+        """Called once per run after all calls to process when no more builds
+        will be created. Modules must not add builds here.
+
+        builds: a list of all Build objects.
+        module_config: a dictionary with the module config.
+        """
+        pass
+
     def execute(self, build, module_config):
         """Runs this module on a build.
 
@@ -67,3 +85,14 @@ class Module(object):
         module_config: a dictionary with the module config.
         """
         pass
+
+    def execute_many(self, builds, module_config):
+        """Runs this module on many builds which use the same pipeline. Modules
+        can override this method to perform the setup shared by the builds
+        only once.
+
+        builds: a list of Build objects.
+        module_config: a dictionary with the module config.
+        """
+        for build in builds:
+            self.execute(build, module_config)
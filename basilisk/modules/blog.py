@@ -35,6 +35,55 @@ class DummyBuild(Build):
             return 'title: {}'.format(self.year).encode('utf-8')
 
 
+class PageBuild(Build):
+    """Archive page of a paginated blog, see BlogModule."""
+
+    def __init__(self, input_path, output_path, number):
+        super().__init__(input_path, output_path)
+        self.number = number
+
+    def read(self, path):
+        return 'title: Page {}'.format(self.number).encode('utf-8')
+
+
+class BlogIndex(object):
+    """Articles of a blog indexed by their dates. Entries are bucketed by date
+    when they are added and sorted only once when the listing or the tree is
+    created. Entries published on the same day are ordered by their paths so
+    that the order doesn't depend on the order in which the files were found.
+    """
+
+    def __init__(self):
+        # Lists of entries keyed by (year, month, day) tuples.
+        self.days = {}
+
+    def add(self, entry):
+        date = entry['date']
+        key = (date['year'], date['month'], date['day'])
+        self.days.setdefault(key, []).append(entry)
+
+    def sorted_days(self, reverse=False):
+        """Yields tuples (date, entries) in chronological order."""
+        for key in sorted(self.days, reverse=reverse):
+            yield key, sorted(self.days[key], key=lambda entry: entry['path'])
+
+    def listing(self):
+        """Returns a list of all entries starting with the newest ones."""
+        listing = []
+        for _, entries in self.sorted_days(reverse=True):
+            listing.extend(entries)
+        return listing
+
+    def tree(self):
+        """Returns a year/month/day tree with the lists of entries at the
+        lowest level in chronological order.
+        """
+        tree = {}
+        for (year, month, day), entries in self.sorted_days():
+            tree.setdefault(year, {}).setdefault(month, {})[day] = entries
+        return tree
+
+
 class FeedBuild(Build):
 
     def __init__(self, input_path, output_path, blog_directory, listing):
@@ -99,6 +148,23 @@ class BlogModule(Module):
     every build. The articles should be placed under year/month/day the
     specified blog directory, for example my_blog/2018/10/28/my_post/index.html.
 
+    If "per_page" is set for a blog directory the listing is also split into
+    pages. The first page is added to the context of the index of the blog
+    directory, the remaining pages are created as builds located at
+    "page/N/index.html" in the blog directory. For those builds the context
+    additionally contains:
+
+        'page': {
+            'number': 2,
+            'count': 3,
+            'entries': [...],
+            'previous': '',
+            'next': 'page/3'
+        }
+
+    Paths of the previous and next pages are relative to the blog directory
+    and are None if there is no such page.
+
     Additional context example:
 
         {
@@ -148,6 +214,7 @@ class BlogModule(Module):
                         "name": "thoughts",
                         "directory": "thoughts/",
                         "insert_dummy_builds": true,
+                        "per_page": 20,
                         "feed": {
                             "title": "Thoughts",
                             "base_url": "https://example.com/",
@@ -166,8 +233,22 @@ class BlogModule(Module):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.created_builds = []
-        self.created_feed_builds = []
+        self.reset()
+
+    def reset(self):
+        # Tuples identifying the builds created by this module, see
+        # dummy_build_was_created, page_build_was_created and
+        # feed_build_was_created.
+        self.created_builds = set()
+        self.created_page_builds = set()
+        self.created_feed_builds = set()
+
+        # BlogIndex objects and the listing and tree created from them keyed
+        # by the blog directories. The listing and the tree are updated in
+        # place as articles are added by the calls to process.
+        self.indexes = {}
+        self.listings = {}
+        self.trees = {}
 
     def blog_directories(self, module_config):
         directories = self.config_get(module_config, 'directories', [])
@@ -178,9 +259,7 @@ class BlogModule(Module):
     def create_entry(self, build, blog_directory):
         # Here we have to cheat a little to get the params by reading the
         # file at this point.
-        inpath = os.path.join(self.builder.source_directory, build.input_path)
-        b = build.read(inpath)
-        content, parameters = build.extract_parameters(b)
+        parameters = self.builder.sources.parameters(build)
 
         if not parameters.get('title', None):
             return None
@@ -245,16 +324,10 @@ class BlogModule(Module):
         return path
 
     def dummy_build_was_created(self, blog_directory, year, month, day):
-        for build_blog_directory, build_year, build_month, build_day in self.created_builds:
-            if blog_directory == build_blog_directory and \
-                year == build_year and \
-                month == build_month and \
-                day == build_day:
-                    return True
-        return False
+        return (blog_directory['directory'], year, month, day) in self.created_builds
 
     def register_dummy_build_creation(self, blog_directory, year, month, day):
-        self.created_builds.append((blog_directory, year, month, day))
+        self.created_builds.add((blog_directory['directory'], year, month, day))
 
     def iterate_date_tuples(self, tree_listing):
         for year in tree_listing:
@@ -281,35 +354,51 @@ class BlogModule(Module):
                 self.builder.add_build(build)
                 self.register_dummy_build_creation(blog_directory, year, month, day)
 
-    def insert_into_tree_listing(self, tree_listing, entry):
-        y = entry['date']['year']
-        m = entry['date']['month']
-        d = entry['date']['day']
-
-        if not y in tree_listing:
-            tree_listing[y] = {}
-
-        if not m in tree_listing[y]:
-            tree_listing[y][m] = {}
+    def get_page_path(self, number):
+        """Returns the path of a page relative to the blog directory."""
+        if number == 1:
+            return ''
+        return os.path.join('page', str(number))
 
-        if not d in tree_listing[y][m]:
-            tree_listing[y][m][d] = []
+    def paginate(self, blog_directory, listing):
+        """Returns a dictionary with the context of each page keyed by output
+        paths of the pages.
+        """
+        per_page = blog_directory.get('per_page', None)
+        if not per_page:
+            return {}
+        count = max(1, -(-len(listing) // per_page))
+        pages = {}
+        for number in range(1, count + 1):
+            output_path = os.path.join(blog_directory['directory'],
+                                       self.get_page_path(number), 'index.html')
+            pages[output_path] = {
+                'number': number,
+                'count': count,
+                'entries': listing[(number - 1) * per_page:number * per_page],
+                'previous': self.get_page_path(number - 1) if number > 1 else None,
+                'next': self.get_page_path(number + 1) if number < count else None,
+            }
+        return pages
 
-        tree_listing[y][m][d].append(entry)
-        self.sort_by_date(tree_listing[y][m][d])
+    def page_build_was_created(self, blog_directory, number):
+        return (blog_directory['directory'], number) in self.created_page_builds
 
-    def sort_by_date(self, listing):
-        """Sorts the listing by the date of the article, newest first."""
-        s = lambda entry: '{}-{}-{}'.format(
-                entry['date']['year'],
-                entry['date']['month'],
-                entry['date']['day']
-            )
-        listing.sort(key=s, reverse=True)
+    def insert_page_builds(self, blog_directory, pages):
+        """Creates builds for the pages other than the first one which is the
+        index of the blog directory.
+        """
+        for output_path, page in pages.items():
+            number = page['number']
+            if number > 1 and not self.page_build_was_created(blog_directory, number):
+                self.builder.add_build(PageBuild(output_path, output_path, number))
+                self.created_page_builds.add((blog_directory['directory'], number))
 
-    def add_context(self, build, blog_directory, listing, tree_listing):
+    def add_context(self, build, blog_directory, listing, tree_listing, page=None):
         """Inserts listing and tree_listing into the additional context of the
         provided build.
+
+        page: context of the page if the build is a page of a paginated blog.
         """
         if not 'blog' in build.additional_context:
             build.additional_context['blog'] = {}
@@ -317,14 +406,14 @@ class BlogModule(Module):
             build.additional_context['blog'][blog_directory['name']] = {}
         build.additional_context['blog'][blog_directory['name']]['listing'] = listing
         build.additional_context['blog'][blog_directory['name']]['tree'] = tree_listing
+        if page is not None:
+            build.additional_context['blog'][blog_directory['name']]['page'] = page
 
     def is_in_blog_directory(self, build, blog_directory):
         """Returns True if the build resides in the blog directory (is part of
         the given blog).
         """
-        paths = [build.output_path, blog_directory['directory']]
-        prefix = os.path.commonprefix(paths)
-        return prefix == blog_directory['directory']
+        return build.output_path.startswith(blog_directory['directory'])
 
     def insert_feed_builds(self, builds, blog_directory, listing):
         """Creates feed builds."""
@@ -343,43 +432,58 @@ class BlogModule(Module):
         raise ValueError('Invalid feed type {}'.format(feed_type))
 
     def feed_build_was_created(self, blog_directory, feed_type):
-        for build_blog_directory, build_feed_type in self.created_feed_builds:
-            if blog_directory['directory'] == build_blog_directory['directory'] \
-                and feed_type == build_feed_type:
-                return True
-        return False
+        return (blog_directory['directory'], feed_type) in self.created_feed_builds
 
     def register_feed_build_creation(self, blog_directory, build_feed_type):
-        self.created_feed_builds.append((blog_directory, build_feed_type))
+        self.created_feed_builds.add((blog_directory['directory'], build_feed_type))
 
     def process(self, builds, module_config):
         for blog_directory in self.blog_directories(module_config):
             self.logger.debug('blog directory %s', blog_directory)
 
+            directory = blog_directory['directory']
+            articles = [
+                b for b in builds
+                if self.is_in_blog_directory(b, blog_directory)
+                and not isinstance(b, (DummyBuild, PageBuild))
+            ]
+            self.builder.sources.prefetch_parameters(articles)
+
+            # Scan for entires that are filed under .../year/month/day/...
+            created = directory not in self.indexes
+            index = self.indexes.setdefault(directory, BlogIndex())
+            listing = self.listings.setdefault(directory, [])
+            tree_listing = self.trees.setdefault(directory, {})
+            added = False
+            for build in articles:
+                entry = self.create_entry(build, blog_directory)
+                if entry is not None:
+                    build.additional_context['date'] = entry['date']
+                    index.add(entry)
+                    added = True
+            if not created and not added:
+                continue
+
             # Listing is a chronological listing of all blog articles starting
             # with the newest ones.
-            listing = []
+            listing[:] = index.listing()
 
             # Tree listing is a year/month/day style tree with the lists of
             # articles at the lowest level.
-            tree_listing = {}
-
-            for build in builds:
-                # Scan for entires that are filed under .../year/month/day/...
-                if self.is_in_blog_directory(build, blog_directory):
-                    if not isinstance(build, DummyBuild):
-                        entry = self.create_entry(build, blog_directory)
-                        if entry is not None:
-                            build.additional_context['date'] = entry['date']
-                            listing.append(entry)
-                            self.insert_into_tree_listing(tree_listing, entry)
-
-                # Put the created listing the the additional context of each
-                # build.
-                self.add_context(build, blog_directory, listing, tree_listing)
+            tree_listing.clear()
+            tree_listing.update(index.tree())
 
             self.insert_dummy_builds(builds, blog_directory, tree_listing)
+            self.insert_page_builds(blog_directory, self.paginate(blog_directory, listing))
             self.insert_feed_builds(builds, blog_directory, listing)
 
-            # Sort the entires descending by date.
-            self.sort_by_date(listing)
+    def finish(self, builds, module_config):
+        # Put the created listing the the additional context of each build.
+        for blog_directory in self.blog_directories(module_config):
+            directory = blog_directory['directory']
+            listing = self.listings.get(directory, [])
+            tree_listing = self.trees.get(directory, {})
+            pages = self.paginate(blog_directory, listing)
+            for build in builds:
+                page = pages.get(build.output_path, None)
+                self.add_context(build, blog_directory, listing, tree_listing, page)
@@ -70,4 +70,5 @@ class WebpProcessorBuilder:
 
                 return content
 
+        processor.cache_identity = ('convert', 'webp', 90)
         return processor
@@ -1,7 +1,7 @@
 import os
-import shutil
 import types
 from ..module import Module
+from ..outputs import DirectoryOutputs
 
 
 class CopyModule(Module):
@@ -18,12 +18,12 @@ class CopyModule(Module):
     """
 
     def make_method_execute(self, build):
-        def execute(self, config, source_directory, output_directory):
+        def execute(self, config, source_directory, output_directory, sources=None,
+                    cache=None, outputs=None):
+            if outputs is None:
+                outputs = DirectoryOutputs(output_directory)
             inpath = os.path.join(source_directory, build.input_path)
-            outpath = os.path.join(output_directory, build.output_path)
-            outdir = os.path.dirname(outpath)
-            os.makedirs(outdir, exist_ok=True)
-            shutil.copyfile(inpath, outpath)
+            outputs.copy(build.output_path, inpath)
         return execute
 
     def execute(self, build, module_config):
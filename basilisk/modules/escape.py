@@ -1,4 +1,5 @@
 import html
+from ..content import text_processor
 from ..module import Module
 
 
@@ -16,8 +17,9 @@ class EscapeModule(Module):
     """
 
     def make_processor(self):
+        @text_processor
         def processor(content, *args, **kwargs):
-            return html.escape(content.decode()).encode()
+            return html.escape(content)
         return processor
 
     def execute(self, build, module_config):
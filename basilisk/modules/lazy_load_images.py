@@ -1,9 +1,18 @@
+from ..dom import HtmlVisitor, get_html_stage
 from ..module import Module
-from bs4 import BeautifulSoup
+
+
+class LazyLoadImagesVisitor(HtmlVisitor):
+
+    def visit(self, tag, document):
+        if tag.name == 'img' and tag.get('loading') != 'lazy':
+            tag['loading'] = 'lazy'
+            document.modified = True
 
 
 class LazyLoadImagesModule(Module):
-    """Adds an attribute `loading="lazy"` to all `<img>` tags.
+    """Adds an attribute `loading="lazy"` to all `<img>` tags. This is done
+    by a visitor of an HtmlStage, see list_headers.
 
     Example module definition:
 
@@ -13,14 +22,5 @@ class LazyLoadImagesModule(Module):
 
     """
 
-    def make_processor(self):
-        def processor(content, *args, **kwargs):
-            soup = BeautifulSoup(content.decode(), 'html.parser')
-            for img in soup.find_all("img"):
-                img['loading'] = 'lazy'
-            return str(soup).encode()
-        return processor
-
     def execute(self, build, module_config):
-        processor = self.make_processor()
-        build.processors.append(processor)
+        get_html_stage(build).add_visitor(LazyLoadImagesVisitor())
@@ -1,8 +1,34 @@
 import slugify
-import bs4
+from ..dom import HtmlVisitor, get_html_stage
 from ..module import Module
 
 
+class HeadersVisitor(HtmlVisitor):
+
+    def __init__(self, module, build):
+        self.module = module
+        self.build = build
+
+    def start(self, document):
+        self.headers = []
+
+    def visit(self, tag, document):
+        if tag.name in self.module.header_names:
+            self.module.set_header_id(len(self.headers), tag)
+            self.headers.append(self.module.create_header_entry(tag))
+
+    def finish(self, document):
+        headers = {
+            'list': self.headers
+        }
+        self.build.additional_context['headers'] = headers
+        if document.context is not None:
+            document.context['headers'] = headers
+        if len(self.headers) > 0:
+            document.modified = True
+            document.pretty = True
+
+
 class ListHeadersModule(Module):
     """Scans the content of a build for HTML headers such as <h1> and adds a
     list of those headers to the build's context. That list is then available
@@ -23,6 +49,10 @@ class ListHeadersModule(Module):
             }
         }
 
+    The headers are found using a visitor of an HtmlStage so the page is
+    parsed only once together with other modules rewriting HTML, such as
+    lazy_load_images, placed next to this module in the pipeline.
+
     Example module definition:
 
         {
@@ -48,27 +78,5 @@ class ListHeadersModule(Module):
                 'string': header.string
         }
 
-    def extract_and_modify_headers(self, content):
-        headers = []
-        soup = bs4.BeautifulSoup(content, features='html.parser')
-        for child in soup.descendants:
-            if child.name in self.header_names:
-                self.set_header_id(len(headers), child)
-                header_entry = self.create_header_entry(child)
-                headers.append(header_entry)
-        if len(headers) > 0:
-            content = soup.prettify()
-        return content, headers
-
-    def make_processor(self, build):
-        def processor(content, *args, **kwargs):
-            content, headers = self.extract_and_modify_headers(content)
-            build.additional_context['headers'] = {
-                'list': headers
-            } 
-            return content
-        return processor
-
     def execute(self, build, module_config):
-        processor = self.make_processor(build)
-        build.processors.append(processor)
+        get_html_stage(build).add_visitor(HeadersVisitor(self, build))
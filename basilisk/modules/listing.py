@@ -1,7 +1,190 @@
 import os
+import bisect
+import fnmatch
+from ..fingerprint import Fingerprinter
 from ..module import Module
 
 
+class DirectoryContent(dict):
+    """A dictionary with the contents of a directory of a Listing keyed by
+    names in the order in which they were added.
+    """
+
+    def __init__(self, listing, path):
+        super().__init__()
+        self._listing = listing
+        self._path = path
+
+    def __fingerprint__(self):
+        return self._listing.__fingerprint__() + self._path.encode('utf-8', 'surrogatepass')
+
+
+class Listing(DirectoryContent):
+    """An index of all files which will be created in the output directory.
+    The listing is a dictionary with the contents of the root directory and
+    provides queries which don't require walking the listing in the
+    templates:
+
+        listing.get('about/index.html')
+        listing.children('about')
+        listing.glob('articles/*', sort='date', reverse=True, limit=10)
+
+    Files are represented by dictionaries with the keys 'type' (always
+    'file'), 'name', 'path' and 'parameters'. Directories are represented by
+    dictionaries with the keys 'type' (always 'directory'), 'name', 'path'
+    and 'content'. The content of a directory is a DirectoryContent. Entries
+    of directories are kept in the order in which the files were added. A
+    single listing is shared by all builds so the indexes used by the queries
+    are computed once and reused by all templates.
+
+    Paths are relative to the output directory and use the separator of the
+    operating system just like Build.output_path.
+    """
+
+    def __init__(self):
+        super().__init__(self, '')
+
+        # DirectoryContent objects keyed by the paths of the directories. The
+        # root directory has an empty path.
+        self._directories = {'': self}
+
+        # File nodes keyed by their paths in the order in which they were
+        # added.
+        self._files = {}
+
+        # Lazily computed sorted list of paths of all files.
+        self._paths = None
+
+        # Results of glob keyed by the arguments.
+        self._queries = {}
+
+        self._fingerprint = None
+
+    def add(self, path, parameters):
+        """Adds a file to the listing and returns the path of the directory
+        containing it.
+
+        path: path of the file relative to the output directory.
+        parameters: parameters of the file, see SourceStore.parameters.
+        """
+        parts = path.split(os.sep)
+        directory = ''
+        for part in parts[:-1]:
+            child = os.path.join(directory, part)
+            if not child in self._directories:
+                self._directories[child] = DirectoryContent(self, child)
+                self._directories[directory][part] = {
+                    'type': 'directory',
+                    'name': part,
+                    'path': child,
+                    'content': self._directories[child],
+                }
+            directory = child
+        node = {
+            'type': 'file',
+            'name': parts[-1],
+            'path': path,
+            'parameters': parameters,
+        }
+        self._directories[directory][parts[-1]] = node
+        self._files[path] = node
+        self.invalidate()
+        return directory
+
+    def invalidate(self):
+        """Forgets the indexes and results which may have changed after a
+        file was added.
+        """
+        self._paths = None
+        self._queries = {}
+        self._fingerprint = None
+
+    def directory(self, path=''):
+        """Returns the DirectoryContent of the directory with the given path.
+
+        path: path relative to the output directory, an empty string for the
+              root directory.
+        """
+        return self._directories[self.normalize(path)]
+
+    def get(self, path, default=None):
+        """Returns the node of a file or a directory with the given path or
+        the default value if it doesn't exist.
+        """
+        path = self.normalize(path)
+        if path in self._files:
+            return self._files[path]
+        directory, name = os.path.split(path)
+        if name and path in self._directories:
+            return self._directories[directory][name]
+        return default
+
+    def children(self, path=''):
+        """Returns a list of nodes located in the directory with the given
+        path in the order in which they were added or an empty list if the
+        directory doesn't exist.
+        """
+        try:
+            return list(self.directory(path).values())
+        except KeyError:
+            return []
+
+    def glob(self, pattern, sort='path', reverse=False, limit=None):
+        """Returns a list of file nodes with paths matching the pattern, see
+        fnmatch. The asterisk matches the path separator so 'articles/*'
+        matches all files located in the directory 'articles' and in its
+        subdirectories. Only the files located under the part of the pattern
+        preceding the first wildcard are examined.
+
+        sort: 'path' or a name of a parameter by which the files are sorted,
+              files without that parameter are placed first.
+        reverse: sort in descending order.
+        limit: maximum number of returned files.
+        """
+        key = (pattern, sort, reverse, limit)
+        result = self._queries.get(key, None)
+        if result is None:
+            result = self._queries.setdefault(key, self._glob(*key))
+        return result
+
+    def _glob(self, pattern, sort, reverse, limit):
+        pattern = self.normalize(pattern)
+        paths = self.sorted_paths()
+        prefix = pattern
+        for i, c in enumerate(pattern):
+            if c in '*?[':
+                prefix = pattern[:i]
+                break
+        start = bisect.bisect_left(paths, prefix)
+        nodes = []
+        for path in paths[start:]:
+            if not path.startswith(prefix):
+                break
+            if fnmatch.fnmatchcase(path, pattern):
+                nodes.append(self._files[path])
+        if sort != 'path':
+            nodes.sort(key=lambda node: str(node['parameters'].get(sort, '')))
+        if reverse:
+            nodes.reverse()
+        return nodes[:limit]
+
+    def sorted_paths(self):
+        if self._paths is None:
+            self._paths = sorted(self._files)
+        return self._paths
+
+    def normalize(self, path):
+        path = os.path.normpath(path).lstrip(os.sep)
+        return '' if path == os.curdir else path
+
+    def __fingerprint__(self):
+        if self._fingerprint is None:
+            fingerprints = Fingerprinter()
+            files = [(path, node['parameters']) for path, node in self._files.items()]
+            self._fingerprint = fingerprints.digest(files)
+        return self._fingerprint
+
+
 class ListingModule(Module):
     """Adds additional context with lists of files which will be created in the
     output directory. Those lists can be used to create file listings such as
@@ -40,6 +223,23 @@ class ListingModule(Module):
     'about/index.html', the current listing provides a shortcut to view the list
     of files in that particular directory (only that file is present however).
 
+    The listing is a Listing object, a dictionary like the one shown above
+    with entries in the order in which the files were added, files and
+    directories additionally contain the keys 'name' and 'path'. It can also
+    be queried without walking it in the templates:
+
+        {% for article in listing.glob('articles/*', sort='date', reverse=True, limit=10) %}
+            <a href="/{{ article.path }}">{{ article.parameters.title }}</a>
+        {% endfor %}
+
+        {% for entry in listing.children('about') %}
+            {{ entry.name }}
+        {% endfor %}
+
+        {{ listing.get('about/index.html').parameters.title }}
+
+    The current listing is a view of the directory of the file being built.
+
     Example module definition:
 
         {
@@ -48,30 +248,25 @@ class ListingModule(Module):
 
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset()
+
+    def reset(self):
+        # The listing is extended with the builds passed to each call to
+        # process so the builds processed earlier see the later ones.
+        self.listing = Listing()
+
     def process(self, builds, module_config):
-        listing = {}
+        self.builder.sources.prefetch_parameters(builds)
+        directories = []
         for build in builds:
-            parts = build.output_path.split(os.sep)
-            current = listing
-            for part in parts[:-1]:
-                if not part in current:
-                    current[part] = {
-                        'type': 'directory',
-                        'content': {}
-                    }
-                current = current[part]['content']
-
             # Here we have to cheat a little to get the params by reading the
             # file at this point.
-            inpath = os.path.join(self.builder.source_directory, build.input_path)
-            b = build.read(inpath)
-            _, parameters = build.extract_parameters(b)
-
-            current[parts[-1]] = {
-                'type': 'file',
-                'parameters': parameters
-            }
+            parameters = self.builder.sources.parameters(build)
+            directories.append(self.listing.add(build.output_path, parameters))
 
-            # Put the created listings the the additional context.
-            build.additional_context['listing'] = listing
-            build.additional_context['current_listing'] = current
+        # Put the created listings the the additional context.
+        for build, directory in zip(builds, directories):
+            build.additional_context['listing'] = self.listing
+            build.additional_context['current_listing'] = self.listing.directory(directory)
@@ -1,5 +1,6 @@
 import subprocess
 import fnmatch
+from ..content import text_processor
 from ..module import Module
 
 
@@ -33,8 +34,9 @@ class ManualsModule(Module):
     """
 
     def make_processor(self, macro):
+        @text_processor
         def processor(content, *args, **kwargs):
-            return troff_to_txt(content.decode(), macro).encode()
+            return troff_to_txt(content, macro)
         return processor
 
     def get_macro(self, build, module_config):
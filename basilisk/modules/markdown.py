@@ -1,4 +1,5 @@
 import markdown
+from ..content import text_processor
 from ..module import Module
 from ..helpers import replace_last_ext
 
@@ -15,12 +16,22 @@ class MarkdownModule(Module):
 
     """
 
+    # Markdown extensions which are enabled.
+    extensions = ['tables']
+
     def make_processor(self):
+        @text_processor
         def processor(content, *args, **kwargs):
-            return markdown.markdown(content.decode(), extensions=['tables']).encode()
+            return markdown.markdown(content, extensions=self.extensions)
+        processor.cache_identity = ('markdown', markdown.__version__, self.extensions)
         return processor
 
     def execute(self, build, module_config):
+        self.execute_many([build], module_config)
+
+    def execute_many(self, builds, module_config):
+        # The processor doesn't depend on the build so it is shared.
         processor = self.make_processor()
-        build.processors.append(processor)
-        build.output_path = replace_last_ext(build.output_path, '.html')
+        for build in builds:
+            build.processors.append(processor)
+            build.output_path = replace_last_ext(build.output_path, '.html')
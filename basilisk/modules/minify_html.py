@@ -1,9 +1,12 @@
 import htmlmin # type: ignore
+from ..content import text_processor
 from ..module import Module
 
 
 class MinifyHtmlModule(Module):
-    """Runs the content through an HTML minifier.
+    """Runs the content through an HTML minifier. The minifier works on text,
+    so this module should be placed after the modules rewriting HTML, see
+    HtmlStage.
 
     Example module definition:
 
@@ -14,8 +17,9 @@ class MinifyHtmlModule(Module):
     """
 
     def make_processor(self):
+        @text_processor
         def processor(content, *args, **kwargs):
-            return htmlmin.minify(content.decode()).encode()
+            return htmlmin.minify(content)
         return processor
 
     def execute(self, build, module_config):
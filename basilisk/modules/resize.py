@@ -3,8 +3,9 @@ import io
 import subprocess
 import tempfile
 import pathlib
-from ..module import Module
+import PIL
 from PIL import Image
+from ..module import Module
 
 
 class ResizeModule(Module):
@@ -81,6 +82,13 @@ class ImageResizerProcessorBuilder:
                             kwargs['exif'] = image.info['exif']
                         resized_image.save(output, fmt, **kwargs)
                         return output.getvalue()
+        processor.cache_identity = (
+            'resize',
+            PIL.__version__,
+            ImageResizerProcessorBuilder._get_format(build),
+            module.config_get(module_config, 'max_width', None),
+            module.config_get(module_config, 'max_height', None),
+        )
         return processor
 
 
@@ -174,4 +182,12 @@ class VideoResizerProcessorBuilder:
             target_width, target_height = VideoResizerProcessorBuilder._get_target_size(module, module_config, input_width, input_height)
             return VideoResizerProcessorBuilder._resize(build, content, target_width, target_height)
 
+        # Extensions of the files decide which formats are used by ffmpeg.
+        processor.cache_identity = (
+            'resize',
+            os.path.splitext(build.input_path)[1].lower(),
+            os.path.splitext(build.output_path)[1].lower(),
+            module.config_get(module_config, 'max_width', None),
+            module.config_get(module_config, 'max_height', None),
+        )
         return processor
@@ -42,7 +42,9 @@ class ScriptingModule(Module):
         r = subprocess.run(command, shell=True)
         r.check_returncode()
 
-    def process(self, builds, module_config):
+    def finish(self, builds, module_config):
+        # Scripts are executed once per run even if process is called many
+        # times.
         for command in self.get_scripts(module_config):
             command = self.replace_placeholders(command)
             self.logger.debug('Running: {}'.format(command))
@@ -1,8 +1,26 @@
 import os
+import hashlib
+from ..content import text_processor
 from ..module import Module
 from ..templates import Jinja2Templates
 
 
+class TemplateContext(dict):
+    """Describes a template in the context of the builds. The fingerprint of
+    the template depends on its path relative to the templates directory and
+    its content instead of the absolute path and the modification time so that
+    cached outputs can be reused by a checkout of the project located in a
+    different directory.
+    """
+
+    def __init__(self, path, modified, fingerprint):
+        super().__init__(path=path, modified=modified)
+        self.fingerprint = fingerprint
+
+    def __fingerprint__(self):
+        return self.fingerprint
+
+
 class TemplatesModule(Module):
     """Runs all files through templates. The templates should be present in the
     templates directory which is specified in the config file. The path to the
@@ -22,12 +40,21 @@ class TemplatesModule(Module):
         3. dir1/_base.html
         4. _base.html
 
+    Compiled templates are stored in the cache together with the outputs so
+    that they don't have to be compiled again by the next build or by other
+    processes, this can be disabled by setting "bytecode_cache" to false. By default
+    Jinja2 checks if a template changed every time it is used, as the templates
+    are reloaded by the builder when they change this can be disabled by
+    setting "auto_reload" to false.
+
     Example module definition:
 
         {
             "name": "templates",
             "config": {
-                "templates_directory": "_templates"
+                "templates_directory": "_templates",
+                "bytecode_cache": true,
+                "auto_reload": true
             }
         }
 
@@ -36,13 +63,17 @@ class TemplatesModule(Module):
 
     config_key = 'templates'
 
-    def make_processor(self, templates, input_path):
+    def make_processor(self, templates, build):
+        @text_processor
         def processor(content, context):
             template_context = {
-                'content': content.decode(),
+                'content': content,
             }
             template_context.update(context)
-            return templates.render(input_path, template_context).encode()
+            content = templates.render(build.input_path, template_context)
+            for path in templates.dependencies(build.input_path):
+                build.dependencies.add(os.path.relpath(path, self.builder.source_directory))
+            return content
         return processor
     
     def get_templates_dir(self, module_config):
@@ -53,17 +84,50 @@ class TemplatesModule(Module):
     def get_templates(self, module_config):
         if not hasattr(self, 'templates'):
             templates_dir = self.get_templates_dir(module_config)
-            self.templates = Jinja2Templates(templates_dir)
+            bytecode_storage = None
+            if self.config_get(module_config, 'bytecode_cache', True):
+                bytecode_storage = self.builder.build_cache.storage
+            self.templates = Jinja2Templates(
+                templates_dir,
+                bytecode_storage=bytecode_storage,
+                auto_reload=self.config_get(module_config, 'auto_reload', True),
+            )
         return self.templates
 
+    def reset(self):
+        # Templates are listed and their context is created only once and
+        # again only if they change when the builder is run many times.
+        if hasattr(self, 'templates'):
+            templates_dir = os.path.relpath(self.templates.template_directory,
+                                            self.builder.source_directory)
+            if self.builder.manifest.is_tree_changed(templates_dir):
+                self.templates.invalidate()
+                self.templates_context = None
+
+    def get_templates_context(self, templates):
+        """Returns a list describing all templates which is shared by all
+        builds.
+        """
+        if getattr(self, 'templates_context', None) is None:
+            self.templates_context = [self.template_context_obj(path) for path in templates.list_templates()]
+        return self.templates_context
+
     def template_context_obj(self, path):
-        return {
-                'path': path,
-                'modified': os.path.getmtime(path),
-        }
+        modified = os.path.getmtime(path)
+        if not hasattr(self, 'template_fingerprints'):
+            # Tuples (modified, fingerprint) keyed by paths.
+            self.template_fingerprints = {}
+        entry = self.template_fingerprints.get(path, None)
+        if entry is None or entry[0] != modified:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).digest()
+            name = os.path.relpath(path, self.templates.template_directory)
+            entry = (modified, name.encode() + b'\0' + digest)
+            self.template_fingerprints[path] = entry
+        return TemplateContext(path, modified, entry[1])
 
     def execute(self, build, module_config):
         templates = self.get_templates(module_config)
-        processor = self.make_processor(templates, build.input_path)
+        processor = self.make_processor(templates, build)
         build.processors.append(processor)
-        build.additional_context['templates'] = [self.template_context_obj(path) for path in templates.list_templates()]
+        build.additional_context['templates'] = self.get_templates_context(templates)
@@ -0,0 +1,181 @@
+import os
+import hashlib
+import threading
+from .cache import atomic_write, copy_file
+
+
+class DirectoryOutputs(object):
+    """Stores the outputs as files in the output directory. This is the
+    default, see MemoryOutputs. Files are replaced atomically so that the
+    development server never serves a partially written file.
+
+    Example usage:
+
+        outputs = DirectoryOutputs(output_directory)
+        outputs.write('index.html', b'<p>Text</p>')
+
+    directory: output directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, output_path):
+        return os.path.join(self.directory, output_path)
+
+    def write(self, output_path, content: bytes):
+        """Creates the output with the given content.
+
+        output_path: path relative to the output directory.
+        """
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+        atomic_write(self.path(output_path), write)
+
+    def copy(self, output_path, source_path, reference=True):
+        """Creates the output with the contents of a file.
+
+        source_path: path to the copied file.
+        reference: False if the copied file can be removed later, see
+                   MemoryOutputs.
+        """
+        atomic_write(self.path(output_path), lambda tmp_path: copy_file(source_path, tmp_path))
+
+    def exists(self, output_path):
+        return os.path.isfile(self.path(output_path))
+
+    def file_path(self, output_path):
+        """Returns a path to a file with the contents of the output or None if
+        the output is not stored in a file.
+        """
+        return self.path(output_path)
+
+    def read(self, output_path) -> bytes:
+        with open(self.path(output_path), 'rb') as f:
+            return f.read()
+
+    def remove(self, output_path):
+        """Removes the output and the directories left empty."""
+        path = self.path(output_path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        while os.path.normpath(directory) != os.path.normpath(self.directory):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def take(self, output_path):
+        """Returns the output created by a worker process so that it can be
+        added to the outputs of the main process using add. Returns None if
+        the output is already visible to the main process.
+        """
+        return None
+
+    def add(self, output_path, output):
+        pass
+
+
+class MemoryOutput(object):
+    """An output held by MemoryOutputs. Either content or path is set.
+
+    content: bytes.
+    path: path to a file with the contents of the output.
+    etag: entity tag identifying this version of the output.
+    """
+
+    def __init__(self, content=None, path=None, etag=None):
+        self.content = content
+        self.path = path
+        self.etag = etag
+
+
+class MemoryOutputs(DirectoryOutputs):
+    """Holds the outputs in memory instead of writing them to the output
+    directory so that rebuilding a website doesn't remove and write thousands
+    of files, used by the development server. Large copied files are not read
+    at all, instead the path to the copied file is remembered. The entity tag
+    of each output is computed once when it is created so that the server can
+    answer conditional requests without reading the output.
+
+    The output directory is still used for the files created by other means,
+    for example by the scripts of the scripting module. Those scripts don't
+    see the outputs held in memory.
+
+    Example usage:
+
+        outputs = MemoryOutputs(output_directory)
+        builder = Builder(source_directory, output_directory, outputs=outputs)
+        builder.run()
+        output = outputs.get('index.html')
+
+    directory: output directory.
+    """
+
+    # Copied files at least this large are referenced instead of being read.
+    reference_size = 1024 * 1024 # [bytes]
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.lock = threading.Lock()
+
+        # MemoryOutput objects keyed by normalized output paths.
+        self.outputs = {}
+
+    def __getstate__(self):
+        # Worker processes start with no outputs, see take.
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    def key(self, output_path):
+        return os.path.normpath(output_path)
+
+    def get(self, output_path):
+        """Returns a MemoryOutput or None if the output doesn't exist."""
+        with self.lock:
+            return self.outputs.get(self.key(output_path), None)
+
+    def write(self, output_path, content: bytes):
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        self.add(output_path, MemoryOutput(content=bytes(content), etag=etag))
+
+    def copy(self, output_path, source_path, reference=True):
+        stat = os.stat(source_path)
+        if reference and stat.st_size >= self.reference_size:
+            etag = '{:x}-{:x}'.format(stat.st_size, stat.st_mtime_ns)
+            self.add(output_path, MemoryOutput(path=os.path.abspath(source_path), etag=etag))
+        else:
+            with open(source_path, 'rb') as f:
+                self.write(output_path, f.read())
+
+    def exists(self, output_path):
+        return self.get(output_path) is not None
+
+    def file_path(self, output_path):
+        return self.get(output_path).path
+
+    def read(self, output_path) -> bytes:
+        output = self.get(output_path)
+        if output.path is not None:
+            with open(output.path, 'rb') as f:
+                return f.read()
+        return output.content
+
+    def remove(self, output_path):
+        with self.lock:
+            self.outputs.pop(self.key(output_path), None)
+
+    def take(self, output_path):
+        with self.lock:
+            return self.outputs.pop(self.key(output_path), None)
+
+    def add(self, output_path, output):
+        with self.lock:
+            self.outputs[self.key(output_path)] = output
@@ -0,0 +1,91 @@
+import os
+import re
+import fnmatch
+
+
+# Characters which have a special meaning in the patterns, see fnmatch.
+wildcards = re.compile(r'[*?[]')
+
+
+class Pipelines(object):
+    """Selects the pipeline used to create each build. The pipelines are
+    validated and their patterns are compiled once when the config is loaded.
+    Patterns without wildcards are compared with the path and patterns of the
+    form "*.ext" are checked using str.endswith, other patterns are converted
+    to regular expressions. The first pipeline with a pattern matching the
+    input path of a build is selected, the result is remembered for each path.
+
+    Example usage:
+
+        pipelines = Pipelines(config['pipelines'])
+        pipeline = pipelines.get(build.input_path)
+
+    pipelines: a list of pipeline definitions from the config.
+    """
+
+    def __init__(self, pipelines):
+        self.pipelines = pipelines
+
+        # Tuples (pipeline, matcher) in the order in which they are checked.
+        # Matchers are passed a normalized path and return True if it matches.
+        self.matchers = []
+        for pipeline in pipelines:
+            self.validate(pipeline)
+            for pattern in pipeline['patterns']:
+                self.matchers.append((pipeline, self.compile(pattern)))
+
+        # Selected pipelines keyed by paths.
+        self.memo = {}
+
+    def validate(self, pipeline):
+        for key in ['patterns', 'modules']:
+            if not key in pipeline:
+                raise ValueError('missing property: {}'.format(key))
+        for module_definition in pipeline['modules']:
+            if not 'name' in module_definition:
+                raise ValueError('missing property: name')
+        jobs = pipeline.get('jobs', None)
+        if jobs is not None and (not isinstance(jobs, int) or jobs < 1):
+            raise ValueError('invalid property: jobs')
+
+    def compile(self, pattern):
+        """Returns a matcher equivalent to fnmatch.fnmatch for the pattern."""
+        pattern = os.path.normcase(pattern)
+        if not wildcards.search(pattern):
+            return pattern.__eq__
+        if pattern.startswith('*') and not wildcards.search(pattern, 1):
+            suffix = pattern[1:]
+            return lambda path: path.endswith(suffix)
+        regex = re.compile(fnmatch.translate(pattern))
+        return lambda path: regex.match(path) is not None
+
+    def get(self, path):
+        """Returns the pipeline for the input path or None if no pipeline
+        matches it.
+
+        path: path relative to the source directory.
+        """
+        try:
+            return self.memo[path]
+        except KeyError:
+            pass
+        normalized = os.path.normcase(path)
+        selected = None
+        for pipeline, matcher in self.matchers:
+            if matcher(normalized):
+                selected = pipeline
+                break
+        self.memo[path] = selected
+        return selected
+
+    def group(self, builds):
+        """Returns a list of tuples (pipeline, builds) with the builds grouped
+        by their pipelines. The groups are ordered like the pipelines and the
+        builds in each group retain their order.
+        """
+        groups = {}
+        for build in builds:
+            pipeline = self.get(build.input_path)
+            groups.setdefault(id(pipeline), (pipeline, []))[1].append(build)
+        order = {id(pipeline): i for i, pipeline in enumerate(self.pipelines)}
+        return sorted(groups.values(), key=lambda group: order.get(id(group[0]), len(order)))
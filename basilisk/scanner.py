@@ -0,0 +1,90 @@
+import os
+import concurrent.futures
+
+
+class Scanner(object):
+    """Finds the files located in a directory using os.scandir. Ignored
+    directories are skipped without listing their contents. The directories
+    located directly in the scanned directory are walked in parallel so that
+    the latency of listing directories and retrieving the results of os.stat
+    is spread across many threads on wide trees. Just like os.walk symbolic
+    links to directories are not followed.
+
+    Example usage:
+
+        scanner = Scanner(source_directory, ignore_directory, ignore_file)
+        for path, stat in scanner.scan():
+            print(path, stat.st_size)
+
+    directory: directory to scan.
+    ignore_directory: a function which is passed a path to a directory
+                      relative to the scanned directory and returns True if
+                      the directory should be skipped.
+    ignore_file: a function which is passed a path to a file relative to the
+                 scanned directory and returns True if the file should be
+                 skipped.
+    jobs: maximum number of threads, None picks the default of
+          ThreadPoolExecutor.
+    """
+
+    def __init__(self, directory, ignore_directory, ignore_file, jobs=None):
+        self.directory = directory
+        self.ignore_directory = ignore_directory
+        self.ignore_file = ignore_file
+        self.jobs = jobs
+
+    def scan(self):
+        """Returns a list of tuples (path, stat) of all files which are not
+        ignored. The paths are relative to the scanned directory, the stat is
+        the result of os.stat or None if it could not be retrieved.
+        """
+        files, directories = self.list_directory('')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for result in executor.map(self.walk, directories):
+                files.extend(result)
+        return files
+
+    def walk(self, directory):
+        """Returns the files located in the directory and its subdirectories,
+        see scan.
+
+        directory: path relative to the scanned directory.
+        """
+        files = []
+        stack = [directory]
+        while stack:
+            directory_files, directories = self.list_directory(stack.pop())
+            files.extend(directory_files)
+            stack.extend(reversed(directories))
+        return files
+
+    def list_directory(self, directory):
+        """Returns a tuple (files, directories) where files is a list of
+        tuples (path, stat) and directories is a list of paths of the
+        subdirectories which should be walked.
+        """
+        files = []
+        directories = []
+        try:
+            entries = os.scandir(os.path.join(self.directory, directory))
+        except OSError:
+            return files, directories
+        with entries:
+            for entry in entries:
+                path = os.path.join(directory, entry.name)
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if not entry.is_symlink() and not self.ignore_directory(path):
+                        directories.append(path)
+                elif not self.ignore_file(path):
+                    files.append((path, self.stat(entry)))
+        return files, directories
+
+    def stat(self, entry):
+        try:
+            return entry.stat()
+        except OSError:
+            return None
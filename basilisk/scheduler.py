@@ -0,0 +1,386 @@
+import os
+import time
+import sqlite3
+import threading
+import collections
+import concurrent.futures
+
+
+class Scheduler(object):
+    """Submits builds to an executor gradually instead of queueing all of them
+    at once so that the memory used by the builds which are executed at the
+    same time stays bounded. A build is submitted only if:
+
+        1. The number of submitted builds which didn't finish yet is lower
+           than twice the number of workers of the executor.
+        2. The total estimated memory used by the running builds doesn't
+           exceed the `memory_budget` config key. The memory used by a build
+           is estimated from the size of its input file, see cost. A build
+           which doesn't fit in the budget on its own is executed when no
+           other builds are running.
+        3. The number of running builds using the same pipeline doesn't exceed
+           the value of the `jobs` key of the pipeline.
+        4. The number of running builds using the same module doesn't exceed
+           the value defined for that module in the `module_jobs` config key.
+
+    Builds which can't be submitted because of the limits of the pipelines and
+    the modules don't prevent the submission of builds which are not affected
+    by them. Otherwise builds are submitted in order.
+
+    Builds which are expected to take the longest are submitted first so that
+    a long build found at the end of the scan doesn't delay the end of the
+    run, see DurationIndex. Builds requested using prioritize are submitted
+    before all other builds regardless of the limits.
+
+    Example config limiting the number of videos resized at the same time:
+
+        {
+            "memory_budget": 1073741824,
+            "pipelines": [
+                {
+                    "patterns": ["*.mp4"],
+                    "jobs": 2,
+                    "modules": [{"name": "resize"}]
+                }
+            ]
+        }
+
+    Example usage:
+
+        with builder.create_executor() as executor:
+            for future in Scheduler(builder, executor).run(builds):
+                future.result()
+
+    builder: a Builder object.
+    executor: an executor, see ThreadExecutor.
+    """
+
+    def __init__(self, builder, executor):
+        self.builder = builder
+        self.executor = executor
+        self.memory_budget = builder.config.get('memory_budget', None)
+        self.module_jobs = builder.config.get('module_jobs', None) or {}
+        self.max_in_flight = 2 * executor.workers
+        self.durations = builder.durations
+
+        # Lock protecting the state shared with prioritize.
+        self.lock = threading.Lock()
+
+        # Tuples (build, cost, limits) keyed by the output paths of the builds.
+        self.outputs = {}
+
+        # Futures of the submitted builds keyed by ids of the builds.
+        self.submitted = {}
+
+        # Tuples (build, cost, limits) of the builds which should be
+        # submitted immediately, see prioritize.
+        self.prioritized = collections.deque()
+
+        # Futures returned by prioritize for builds which were not submitted
+        # yet keyed by ids of the builds.
+        self.waiters = {}
+
+        # Completed to interrupt waiting for the running builds when a build
+        # is prioritized or the scheduler is cancelled.
+        self.wakeup = concurrent.futures.Future()
+
+        # Set if the builds which were not submitted yet should be skipped.
+        self.cancelled = False
+
+    def cost(self, build):
+        """Returns the estimated number of bytes used by the build while it is
+        executed.
+        """
+        return self.builder.sources.input_size(build)
+
+    def order(self, builds):
+        """Returns a list of tuples (build, cost) sorted by the expected
+        durations of the builds starting with the longest ones, see
+        DurationIndex.
+        """
+        builds = [(build, self.cost(build)) for build in builds]
+        if self.durations is not None:
+            builds.sort(key=lambda item: -self.durations.expected(*item))
+        return builds
+
+    def limits(self, build):
+        """Returns a tuple of (key, jobs) tuples with the limits of the number
+        of builds executed at the same time which apply to the build.
+        """
+        limits = []
+        pipeline = self.builder.get_pipeline(build)
+        if pipeline is None:
+            return ()
+        if pipeline.get('jobs', None):
+            limits.append((('pipeline', id(pipeline)), pipeline['jobs']))
+        for module_definition in pipeline['modules']:
+            name = module_definition['name']
+            if self.module_jobs.get(name, None):
+                limits.append((('module', name), self.module_jobs[name]))
+        return tuple(limits)
+
+    def run(self, builds):
+        """Submits the builds and yields their futures as they are completed.
+        If the caller stops the iteration the builds which were not submitted
+        yet are never executed.
+        """
+        # Queues of tuples (build, cost, limits) which have the same limits.
+        queues = collections.OrderedDict()
+        with self.lock:
+            for build, cost in self.order(builds):
+                limits = self.limits(build)
+                queues.setdefault(limits, collections.deque()).append((build, cost, limits))
+                self.outputs[build.output_path] = (build, cost, limits)
+
+        # Tuples (cost, limits) of the submitted builds keyed by futures.
+        running = {}
+        counts = collections.Counter()
+        memory = 0
+
+        def submit(build, cost, limits):
+            nonlocal memory
+            future = self.executor.submit(build)
+            with self.lock:
+                self.submitted[id(build)] = future
+                for waiter in self.waiters.pop(id(build), []):
+                    chain_future(future, waiter)
+            running[future] = (cost, limits)
+            memory += cost
+            for key, _ in limits:
+                counts[key] += 1
+
+        while queues or running:
+            with self.lock:
+                if self.cancelled:
+                    queues.clear()
+                    self.prioritized.clear()
+                    for waiters in self.waiters.values():
+                        for waiter in waiters:
+                            waiter.cancel()
+                    self.waiters.clear()
+
+            # Prioritized builds are submitted immediately ignoring the limits.
+            with self.lock:
+                prioritized = list(self.prioritized)
+                self.prioritized.clear()
+            for build, cost, limits in prioritized:
+                if not id(build) in self.submitted:
+                    submit(build, cost, limits)
+
+            # A build which doesn't fit in the memory budget stops the
+            # submission of all builds so that it is not starved by the smaller
+            # ones.
+            over_budget = False
+            for limits in list(queues):
+                queue = queues[limits]
+                while queue and len(running) < self.max_in_flight and not over_budget:
+                    build, cost, _ = queue[0]
+                    if id(build) in self.submitted:
+                        queue.popleft()
+                        continue
+                    if any(counts[key] >= jobs for key, jobs in limits):
+                        break
+                    if running and self.memory_budget is not None \
+                            and memory + cost > self.memory_budget:
+                        over_budget = True
+                        break
+                    queue.popleft()
+                    submit(build, cost, limits)
+                if not queue:
+                    del queues[limits]
+
+            if not running:
+                continue
+            with self.lock:
+                wakeup = self.wakeup
+            done, _ = concurrent.futures.wait(list(running) + [wakeup],
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if wakeup in done:
+                with self.lock:
+                    self.wakeup = concurrent.futures.Future()
+            for future in done:
+                if future is wakeup:
+                    continue
+                cost, limits = running.pop(future)
+                memory -= cost
+                for key, _ in limits:
+                    counts[key] -= 1
+                yield future
+
+    def cancel(self):
+        """Stops submitting builds, the builds which were already submitted
+        are still yielded by run.
+        """
+        with self.lock:
+            self.cancelled = True
+            if not self.wakeup.done():
+                self.wakeup.set_result(None)
+
+    def prioritize(self, output_path):
+        """Submits the build creating the output before all other builds which
+        were not submitted yet. Returns a future which is completed when the
+        build is executed or None if the build is not executed by this
+        scheduler or the scheduler was cancelled.
+
+        output_path: path relative to the output directory.
+        """
+        with self.lock:
+            if self.cancelled or not output_path in self.outputs:
+                return None
+            build, cost, limits = self.outputs[output_path]
+            if id(build) in self.submitted:
+                return self.submitted[id(build)]
+            waiter = concurrent.futures.Future()
+            self.waiters.setdefault(id(build), []).append(waiter)
+            self.prioritized.append((build, cost, limits))
+            if not self.wakeup.done():
+                self.wakeup.set_result(None)
+            return waiter
+
+
+def chain_future(source, destination):
+    """Completes the destination future with the result of the source."""
+    def callback(future):
+        if future.exception() is not None:
+            destination.set_exception(future.exception())
+        else:
+            destination.set_result(future.result())
+    source.add_done_callback(callback)
+
+
+class DurationIndex(object):
+    """Records how long it took to execute each build so that the longest
+    builds can be started first during the next run. Builds which were never
+    executed are assumed to take time proportional to the size of their input
+    files, the rate is computed from the recorded builds of the project. The
+    index is stored in an sqlite database and entries for the source directory
+    are loaded into memory when they are first needed.
+
+    Within a project builds are identified by their input and output paths
+    which are relative to the source and output directories so the durations
+    are reused when the project is built into a different output directory,
+    for example a temporary one. Entries which were not used for max_age
+    seconds are removed when the index is saved.
+
+    Example usage:
+
+        durations = DurationIndex(path, source_directory)
+        expected = durations.expected(build, size)
+        durations.record(build, duration, size)
+        durations.save()
+
+    path: path to the database.
+    source_directory: root directory of the project.
+    """
+
+    # Seconds per byte used if no builds with known durations read input
+    # files.
+    default_rate = 1 / (64 * 1024 * 1024)
+
+    # Entries which were not used for this number of seconds are removed.
+    max_age = 30 * 24 * 60 * 60
+
+    def __init__(self, path, source_directory):
+        self.path = path
+        self.source_directory = os.path.abspath(source_directory)
+        self.lock = threading.Lock()
+
+        # Tuples (size, duration) loaded from the database keyed by tuples
+        # (input_path, output_path).
+        self.entries = None
+
+        # Entries which have to be saved in the database keyed by tuples
+        # (input_path, output_path).
+        self.modified = {}
+
+        # Keys of the entries which were used since the index was saved.
+        self.used = set()
+
+        self.rate = None
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS durations ('
+            'source_directory TEXT, input_path TEXT, output_path TEXT, '
+            'size INTEGER, duration REAL, last_used REAL, '
+            'PRIMARY KEY (source_directory, input_path, output_path))'
+        )
+        return connection
+
+    def load(self):
+        with self.lock:
+            if self.entries is None:
+                connection = self.connect()
+                try:
+                    rows = connection.execute(
+                        'SELECT input_path, output_path, size, duration FROM durations '
+                        'WHERE source_directory = ?',
+                        (self.source_directory,)
+                    )
+                    self.entries = {(row[0], row[1]): (row[2], row[3]) for row in rows}
+                finally:
+                    connection.close()
+                size = sum(size for size, _ in self.entries.values() if size)
+                duration = sum(duration for size, duration in self.entries.values() if size)
+                self.rate = duration / size if size else self.default_rate
+
+    def key(self, build):
+        return (build.input_path, build.output_path)
+
+    def expected(self, build, size):
+        """Returns the expected duration of the build in seconds.
+
+        size: size of the input file of the build in bytes.
+        """
+        self.load()
+        key = self.key(build)
+        entry = self.entries.get(key, None)
+        if entry is not None:
+            with self.lock:
+                self.used.add(key)
+            return entry[1]
+        return size * self.rate
+
+    def record(self, build, duration, size):
+        """Records the duration of an executed build in seconds.
+
+        size: size of the input file of the build in bytes.
+        """
+        with self.lock:
+            self.modified[self.key(build)] = (size, duration)
+
+    def save(self):
+        """Saves the recorded durations and removes the entries which were not
+        used for max_age seconds.
+        """
+        with self.lock:
+            modified = self.modified
+            used = self.used - set(modified)
+            self.modified = {}
+            self.used = set()
+        if not modified and not used:
+            return
+        now = time.time()
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?, ?, ?)',
+                    [(self.source_directory, *key, size, duration, now)
+                     for key, (size, duration) in modified.items()]
+                )
+                connection.executemany(
+                    'UPDATE durations SET last_used = ? WHERE source_directory = ? '
+                    'AND input_path = ? AND output_path = ?',
+                    [(now, self.source_directory, *key) for key in used]
+                )
+                connection.execute(
+                    'DELETE FROM durations WHERE last_used < ?',
+                    (now - self.max_age,)
+                )
+        finally:
+            connection.close()
+        if self.entries is not None:
+            self.entries.update(modified)
@@ -2,7 +2,6 @@ import threading
 import tempfile
 import datetime
 import io
-import bs4
 import time
 import flask
 import os
@@ -11,7 +10,9 @@ from werkzeug import serving, utils
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from .builder import Builder
-from .helpers import remove_directory_contents
+from .manifest import Manifest
+from .outputs import MemoryOutputs
+from .exceptions import BuildCancelled
 from . import logging
 
 
@@ -58,26 +59,24 @@ script =  """
 """
 
 
-def create_script_tag(soup):
+def create_script_tag():
     """Creates a <script> tag containing a script which auto refreshes the
     website after the project is rebuilt.
     """
-    script_tag = soup.new_tag('script')
-    script_tag.string = script
-    return script_tag
+    return ('<script>%s</script>' % script).encode('utf-8')
 
 
 def inject_script(bufferedReader):
     """Injects a script into the body of all html files. This script makes the
     website automatically reload itself after changes are detected. This is
-    done using polling.
+    done using polling. The script is inserted before the last closing body
+    tag without parsing the document.
     """
     content = bufferedReader.read()
-    soup = bs4.BeautifulSoup(content, features='html.parser')
-    if soup.body:
-        script_tag = create_script_tag(soup)
-        soup.body.append(script_tag)
-        content = str(soup).encode('utf-8')
+    bufferedReader.close()
+    position = content.lower().rfind(b'</body')
+    if position >= 0:
+        content = content[:position] + create_script_tag() + content[position:]
     return io.BytesIO(content)
 
 
@@ -116,12 +115,43 @@ def iter_file_paths(path):
     yield os.path.join(path, 'index.htm')
 
 
-def create_app(directory_path, status):
+def iter_output_paths(path):
+    """Yields paths relative to the output directory of the files which can be
+    served for the requested path, see iter_file_paths.
+    """
+    path = os.path.normpath(path.strip('/')) if path.strip('/') else ''
+    if path:
+        yield path
+    yield os.path.join(path, 'index.html')
+    yield os.path.join(path, 'index.htm')
+
+
+def send_output(output_path, output):
+    """Creates a response for an output held in memory. The entity tag
+    computed when the output was created is used so conditional requests are
+    answered without reading the output.
+    """
+    if output.path is not None:
+        f = open(output.path, 'rb')
+    else:
+        f = io.BytesIO(output.content)
+    if output_path.endswith('.html') or output_path.endswith('.htm'):
+        f = inject_script(f)
+    return flask.send_file(f, download_name=os.path.basename(output_path),
+                           etag=output.etag, conditional=True)
+
+
+def create_app(directory_path, status, prepare=None, outputs=None):
     """Creates a Flask app which serves files from the specified directory as
     well as a special endpoint used by basilisk to check the compilation
     status. Flask is used instead of using socketserver directly because of
     some truly bizzare "address is already in use" errors that I encountered
     when using it directly (despite freeing up resources on program shutdown).
+
+    prepare: a function which is passed the requested path before the file is
+             served, it can be used to make sure the file is up to date.
+    outputs: a MemoryOutputs object, outputs held in it are served before the
+             files located in the directory.
     """
     app = flask.Flask(__name__, static_folder=None)
 
@@ -147,6 +177,13 @@ def create_app(directory_path, status):
     @app.route('/<path:path>')
     @nocache
     def route_file(path):
+        if prepare is not None:
+            prepare(path)
+        if outputs is not None:
+            for output_path in iter_output_paths(path):
+                output = outputs.get(output_path)
+                if output is not None:
+                    return send_output(output_path, output)
         path = utils.safe_join(directory_path, path)
         for file_path in iter_file_paths(path):
             if os.path.exists(file_path):
@@ -164,7 +201,7 @@ class ServerThread(threading.Thread):
 
     def __init__(self, app, host, port):
         threading.Thread.__init__(self)
-        self.srv = serving.make_server(host, port, app)
+        self.srv = serving.make_server(host, port, app, threaded=True)
 
     def run(self):
         self.srv.serve_forever()
@@ -174,21 +211,48 @@ class ServerThread(threading.Thread):
 
 
 class EventHandler(FileSystemEventHandler):
+    """Collects the paths of files which changed and signals that an event
+    was received.
+    """
 
     def __init__(self):
         self.received_event = threading.Event()
+        self.lock = threading.Lock()
+        self.paths = set()
 
-    def on_created(self, event):
+    def add_paths(self, *paths):
+        with self.lock:
+            self.paths.update(paths)
         self.received_event.set()
 
+    def has_paths(self):
+        """Returns True if paths were collected since the last call to
+        pop_paths.
+        """
+        with self.lock:
+            return bool(self.paths)
+
+    def pop_paths(self):
+        """Returns the paths collected since the last call to this method."""
+        with self.lock:
+            paths = self.paths
+            self.paths = set()
+        return paths
+
+    def on_created(self, event):
+        self.add_paths(event.src_path)
+
     def on_modified(self, event):
-        self.received_event.set()
+        # Directories are modified when their contents change, those changes
+        # generate their own events.
+        if not event.is_directory:
+            self.add_paths(event.src_path)
 
     def on_deleted(self, event):
-        self.received_event.set()
+        self.add_paths(event.src_path)
 
     def on_moved(self, event):
-        self.received_event.set()
+        self.add_paths(event.src_path, event.dest_path)
 
 
 class Server(object):
@@ -196,7 +260,25 @@ class Server(object):
     of the files changes. The output directory is set to a temporary directory
     which is served by the server. In consequence it is possible to run this
     command, open the browser and enjoy automated builds requiring the user to
-    simply refresh the page when needed.
+    simply refresh the page when needed. The same builder is used for all
+    builds so that only the outputs affected by the changed files are built
+    again.
+
+    The server starts serving files before the first compilation finishes. A
+    requested page which is not built yet is built before all other files,
+    see Builder.prioritize. If the source files changed since the last
+    compilation started the next compilation starts immediately instead of
+    waiting for more changes.
+
+    Compilations run in a separate thread. If files change during a
+    compilation it is cancelled and started again with all paths which changed
+    since the last successful compilation, see Builder.cancel. Outputs are
+    replaced atomically and removed only after a successful compilation so the
+    files created by the last complete compilation are served until they are
+    replaced.
+
+    By default the outputs are held in memory instead of being written to the
+    temporary directory, see MemoryOutputs.
 
     Example usage:
 
@@ -204,6 +286,7 @@ class Server(object):
         server.run()
 
     source_directory: root directory of the project to build.
+    in_memory: if false the outputs are written to the temporary directory.
     """
 
     # How often should the loop check if a new event arrived?
@@ -212,11 +295,41 @@ class Server(object):
     # How much time should pass without new events for the compilation to start?
     event_debounce = 1 # [seconds]
 
-    def __init__(self, source_directory, host='localhost', port=8080, progress=False):
+    # How long should a request wait for the requested file to be built?
+    request_timeout = 60 # [seconds]
+
+    def __init__(self, source_directory, host='localhost', port=8080, progress=False,
+                 in_memory=True):
         self.source_directory = source_directory
         self.host = host
         self.port = port
         self.progress = progress
+        self.in_memory = in_memory
+
+        # Outputs shared by all builders, see get_builder.
+        self.outputs = None
+
+        # Builder reused between compilations, see get_builder.
+        self.builder = None
+
+        # Paths relative to the source directory which changed since the last
+        # successful compilation. None means that everything has to be checked.
+        self.changed_paths = None
+
+        # Set while the compilation is running, the generation is incremented
+        # when a compilation starts.
+        self.state = threading.Condition()
+        self.compiling = False
+        self.generation = 0
+
+        # Set by the requests to start the compilation without waiting for
+        # more events.
+        self.compile_requested = threading.Event()
+
+        self.event_handler = EventHandler()
+
+        # Thread running the current compilation, see start_compilation.
+        self.compile_thread = None
 
     def run(self):
         text = 'Starting development server on http://{}:{}'.format(self.host, self.port)
@@ -228,25 +341,31 @@ class Server(object):
 
             status = {}
 
-            self.compile(tmp_directory, status)
+            if self.in_memory:
+                self.outputs = MemoryOutputs(tmp_directory)
 
-            app = create_app(tmp_directory, status)
+            app = create_app(tmp_directory, status, self.prepare, self.outputs)
             server = ServerThread(app, self.host, self.port)
             server.start()
 
-            event_handler = EventHandler()
             observer = Observer()
-            observer.schedule(event_handler, self.source_directory, recursive=True)
+            observer.schedule(self.event_handler, self.source_directory, recursive=True)
             observer.start()
             try:
-                self.watch_events(event_handler, tmp_directory, status)
+                self.start_compilation(tmp_directory, status)
+                self.watch_events(self.event_handler, tmp_directory, status)
             except KeyboardInterrupt:
                 pass
             finally:
                 logger.info('Cleaning up')
+                if self.builder is not None:
+                    self.builder.cancel()
+                if self.compile_thread is not None:
+                    self.compile_thread.join()
                 observer.stop()
                 server.shutdown()
                 server.join()
+                Manifest.remove(tmp_directory)
             observer.join()
 
     def watch_events(self, event_handler, tmp_directory, status):
@@ -256,19 +375,94 @@ class Server(object):
                 last_event = datetime.datetime.now()
                 event_handler.received_event.clear()
 
-            if last_event is not None:
+                # The compilation which is running is already out of date.
+                if event_handler.has_paths() and self.builder is not None:
+                    self.builder.cancel()
+
+            if last_event is not None and not self.is_compiling():
                 time_passed = datetime.datetime.now() - last_event
-                if time_passed > datetime.timedelta(seconds=self.event_debounce):
+                if time_passed > datetime.timedelta(seconds=self.event_debounce) \
+                        or self.compile_requested.is_set():
                     last_event = None
-                    self.compile(tmp_directory, status)
-
-    def compile(self, tmp_directory, status):
+                    self.compile_requested.clear()
+                    self.start_compilation(tmp_directory, status, event_handler.pop_paths())
+
+    def is_compiling(self):
+        return self.compile_thread is not None and self.compile_thread.is_alive()
+
+    def start_compilation(self, tmp_directory, status, paths=()):
+        """Runs compile in a new thread."""
+        self.compile_thread = threading.Thread(target=self.compile,
+                                               args=(tmp_directory, status, paths),
+                                               daemon=True)
+        self.compile_thread.start()
+
+    def prepare(self, path):
+        """Called before a file is served, waits until the files which can be
+        served for the requested path are built if they are not up to date.
+
+        path: requested path.
+        """
+        with self.state:
+            generation = self.generation
+        if self.event_handler.has_paths():
+            # Wait for the compilation which will include the changes.
+            self.compile_requested.set()
+            self.event_handler.received_event.set()
+            with self.state:
+                self.state.wait_for(lambda: self.generation > generation, self.request_timeout)
+
+        output_paths = list(iter_output_paths(path))
+        while True:
+            builder = self.builder
+            if builder is not None and builder.prioritize(output_paths, self.request_timeout):
+                return
+            # The compilation may not have started running the builder yet.
+            with self.state:
+                if not self.compiling:
+                    return
+                self.state.wait(self.event_timeout)
+
+    def add_changed_paths(self, paths):
+        if self.changed_paths is not None:
+            for path in paths:
+                self.changed_paths.add(os.path.relpath(path, self.source_directory))
+
+    def get_builder(self, tmp_directory):
+        """Returns the builder used during the previous compilation unless the
+        config file changed.
+        """
+        if self.builder is not None and self.changed_paths is not None:
+            if self.builder.config_file in self.changed_paths:
+                self.builder = None
+        if self.builder is None:
+            self.builder = Builder(self.source_directory, tmp_directory, progress=self.progress,
+                                   outputs=self.outputs)
+        return self.builder
+
+    def compile(self, tmp_directory, status, paths=()):
+        """Builds the website. Changed paths are collected until the build
+        succeeds.
+
+        paths: absolute paths which changed since the last compilation.
+        """
+        with self.state:
+            self.compiling = True
+            self.generation += 1
+            self.state.notify_all()
+        self.add_changed_paths(paths)
         try:
-            remove_directory_contents(tmp_directory)
-            builder = Builder(self.source_directory, tmp_directory, progress=self.progress)
-            builder.run()
+            builder = self.get_builder(tmp_directory)
+            builder.run(self.changed_paths)
+            self.changed_paths = set()
             status['compilationTimestamp'] = time.time()
             logger.info('Compiled!')
+        except BuildCancelled:
+            logger.info('Compilation cancelled, files changed.')
         except:
             logger.error('Compilation failed!')
             traceback.print_exc()
+        finally:
+            with self.state:
+                self.compiling = False
+                self.state.notify_all()
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import collections
+import concurrent.futures
+
+
+class SourceStore(object):
+    """Reads the content of each build once per run and shares it between the
+    modules, the cache and the build itself. Digests and parameters extracted
+    from the content are remembered until the store is cleared. Contents are
+    kept in memory only as long as their total size doesn't exceed max_size,
+    the least recently used ones are evicted first. Contents larger than
+    max_entry_size are never kept so that large assets are not pinned in
+    memory.
+
+    Example usage:
+
+        sources = SourceStore(source_directory)
+        parameters = sources.parameters(build)
+        content, parameters = sources.extract(build)
+
+    source_directory: root directory of the project.
+    index: a ParametersIndex used to retrieve the parameters of the files which
+           didn't change without reading them.
+    digest_index: a DigestIndex used to retrieve the digests of the files
+                  which didn't change without reading them.
+    """
+
+    max_size = 64 * 1024 * 1024 # [bytes]
+
+    max_entry_size = 4 * 1024 * 1024 # [bytes]
+
+    def __init__(self, source_directory, index=None, digest_index=None):
+        self.source_directory = source_directory
+        self.index = index
+        self.digest_index = digest_index
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forgets everything, called at the beginning of every run."""
+        with self.lock:
+            # Contents and extracted contents keyed by (kind, key) tuples.
+            self.entries = collections.OrderedDict()
+            self.size = 0
+
+            self.digests = {}
+            self._parameters = {}
+
+            # Results of os.stat of the input files keyed by paths relative
+            # to the source directory.
+            self.stats = {}
+
+    def key(self, build):
+        """Contents of files are stored by path. Builds which generate their
+        content are stored by identity.
+        """
+        if build.reads_input_file():
+            return build.input_path
+        return build
+
+    def _get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+        return None
+
+    def _put(self, key, value, size):
+        if size > self.max_entry_size:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def add_stat(self, path, stat):
+        """Remembers the result of os.stat obtained while scanning the source
+        directory so that it doesn't have to be retrieved again.
+
+        path: path relative to the source directory.
+        """
+        self.stats[path] = stat
+
+    def stat(self, build):
+        """Returns the result of os.stat for the input file of the build."""
+        stat = self.stats.get(build.input_path, None)
+        if stat is None:
+            stat = os.stat(os.path.join(self.source_directory, build.input_path))
+            self.stats[build.input_path] = stat
+        return stat
+
+    def input_size(self, build):
+        """Returns the size of the input file of the build in bytes or 0 if
+        the build doesn't read an input file.
+        """
+        if not build.reads_input_file():
+            return 0
+        try:
+            return self.stat(build).st_size
+        except OSError:
+            return 0
+
+    def read(self, build) -> bytes:
+        """Returns the content of the build."""
+        key = self.key(build)
+        content = self._get(('content', key))
+        if content is None:
+            inpath = os.path.join(self.source_directory, build.input_path)
+            content = build.read(inpath)
+            self.digests[key] = hashlib.sha256(content).digest()
+            self._put(('content', key), content, len(content))
+        return content
+
+    def digest(self, build) -> bytes:
+        """Returns the SHA-256 digest of the content of the build. Input files
+        are hashed without keeping them in memory.
+        """
+        key = self.key(build)
+        if not key in self.digests:
+            if build.reads_input_file():
+                self.digests[key] = self.digest_file(build)
+            else:
+                self.read(build)
+        return self.digests[key]
+
+    def digest_file(self, build) -> bytes:
+        inpath = os.path.join(self.source_directory, build.input_path)
+        stat = self.stat(build)
+        if self.digest_index is not None:
+            digest = self.digest_index.get(inpath, stat)
+            if digest is not None:
+                return digest
+        digest = hash_file(inpath)
+        if self.digest_index is not None:
+            self.digest_index.put(inpath, stat, digest)
+        return digest
+
+    def extract(self, build):
+        """Returns the content of the build split into the remaining content
+        and parameters, see Build.extract_parameters.
+        """
+        key = self.key(build)
+        extracted = self._get(('extracted', key))
+        if extracted is None:
+            extracted = build.extract_parameters(self.read(build))
+            self._parameters[key] = extracted[1]
+            self._put(('extracted', key), extracted, len(extracted[0]))
+        return extracted
+
+    def parameters(self, build):
+        """Returns the parameters defined at the top of the input file."""
+        key = self.key(build)
+        if not key in self._parameters:
+            if self.index is not None and build.reads_input_file():
+                inpath = os.path.join(self.source_directory, build.input_path)
+                stat = self.stat(build)
+                parameters = self.index.get(inpath, stat)
+                if parameters is None:
+                    parameters = self.extract(build)[1]
+                    self.index.put(inpath, stat, parameters)
+                self._parameters[key] = parameters
+            else:
+                self.extract(build)
+        return self._parameters[key]
+
+    def prefetch_parameters(self, builds):
+        """Retrieves the parameters of many builds in parallel. Files which are
+        not present in the index are read using a pool of threads.
+        """
+        builds = [b for b in builds if not self.key(b) in self._parameters]
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for future in [executor.submit(self.parameters, b) for b in builds]:
+                future.result()
+
+    def save(self):
+        """Saves the indexes, called at the end of every run."""
+        if self.index is not None:
+            self.index.save()
+        if self.digest_index is not None:
+            self.digest_index.save()
+
+
+class FileIndex(object):
+    """A persistent index of values computed from the files in the source
+    directory. The entries are keyed by the path to the file and its size,
+    modification time and inode, if any of those changed the value has to be
+    computed again. The index is stored in an sqlite database and entries for
+    the source directory are loaded into memory when they are first needed.
+    Child classes define the table and how the values are encoded.
+
+    path: path to the database.
+    source_directory: root directory of the project.
+    """
+
+    table: str
+
+    # Files modified more recently than this are not added to the index as
+    # they could be modified again without changing their modification time.
+    min_age = 2 * 10**9 # [nanoseconds]
+
+    def __init__(self, path, source_directory):
+        self.path = path
+        self.source_directory = source_directory
+        self.lock = threading.Lock()
+
+        # Entries loaded from the database keyed by path.
+        self.entries = None
+
+        # Entries which have to be saved in the database keyed by path.
+        self.modified = {}
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+            'inode INTEGER, value TEXT)' % self.table
+        )
+        return connection
+
+    def load(self):
+        # All paths in the source directory are located between the directory
+        # followed by a separator and the directory followed by the next
+        # character.
+        lower = os.path.join(self.source_directory, '')
+        upper = lower[:-1] + chr(ord(lower[-1]) + 1)
+        with self.lock:
+            if self.entries is None:
+                connection = self.connect()
+                try:
+                    rows = connection.execute(
+                        'SELECT * FROM %s WHERE path >= ? AND path < ?' % self.table,
+                        (lower, upper)
+                    )
+                    self.entries = {row[0]: (tuple(row[1:4]), row[4]) for row in rows}
+                finally:
+                    connection.close()
+
+    def stat_key(self, stat):
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def encode(self, value) -> str:
+        raise NotImplementedError
+
+    def decode(self, data: str):
+        raise NotImplementedError
+
+    def get(self, path, stat):
+        """Returns the value for the file or None if the file is not present
+        in the index or was changed.
+
+        path: absolute path to the file.
+        stat: result of os.stat for this file.
+        """
+        self.load()
+        entry = self.entries.get(path, None)
+        if entry is None or entry[0] != self.stat_key(stat):
+            return None
+        return self.decode(entry[1])
+
+    def put(self, path, stat, value):
+        """Adds the value for the file to the index.
+
+        stat: result of os.stat for this file obtained before reading it.
+        """
+        if time.time_ns() - stat.st_mtime_ns < self.min_age:
+            return
+        with self.lock:
+            self.modified[path] = (self.stat_key(stat), self.encode(value))
+
+    def save(self):
+        with self.lock:
+            modified = self.modified
+            self.modified = {}
+        if not modified:
+            return
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?)' % self.table,
+                    [(path, *key, value) for path, (key, value) in modified.items()]
+                )
+        finally:
+            connection.close()
+        if self.entries is not None:
+            self.entries.update(modified)
+
+
+class ParametersIndex(FileIndex):
+    """Index of the parameters defined at the top of the input files."""
+
+    table = 'parameters'
+
+    def encode(self, value):
+        return json.dumps(value)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class DigestIndex(FileIndex):
+    """Index of the digests of the input files, see SourceStore.digest."""
+
+    table = 'digests'
+
+    def encode(self, value):
+        return value.hex()
+
+    def decode(self, data):
+        return bytes.fromhex(data)
+
+
+def hash_file(path) -> bytes:
+    """Returns the SHA-256 digest of a file without loading the entire file
+    into memory.
+    """
+    m = hashlib.sha256()
+    buf = bytearray(1024 * 1024)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            m.update(view[:n])
+    return m.digest()
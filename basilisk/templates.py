@@ -1,4 +1,5 @@
 import os
+import hashlib
 from .exceptions import TemplateRenderException
 from .helpers import replace_ext
 
@@ -19,6 +20,17 @@ class BaseTemplates(object):
     def __init__(self, template_directory, base_template_name='_base.html'):
         self.template_directory = template_directory
         self.base_template_name = base_template_name
+        self.invalidate()
+
+    def invalidate(self):
+        """Forgets the list of templates and everything computed from it. This
+        has to be called when the templates change.
+        """
+        self._names = None
+
+        # Results of resolve and dependencies keyed by paths of source files.
+        self._resolved = {}
+        self._dependencies = {}
 
     def _template_name_generator(self, path):
         """For the path `subdirectory/name.ext` and base template name
@@ -53,36 +65,140 @@ class BaseTemplates(object):
         """
         raise NotImplementedError
 
-    def list_templates(self):
-        """This method returns a list of paths to all templates that may be
-        used during rendering.
+    def _list_template_names(self):
+        """This method should return a list of relative paths to all
+        templates.
         """
         raise NotImplementedError
 
+    def template_names(self):
+        """Returns a set of relative paths to all templates. The templates are
+        listed only once until the templates are invalidated.
+        """
+        if self._names is None:
+            self._names = frozenset(self._list_template_names())
+        return self._names
+
+    def list_templates(self):
+        """Returns a list of paths to all templates that may be used during
+        rendering.
+        """
+        return [os.path.join(self.template_directory, name) for name in sorted(self.template_names())]
+
+    def _referenced_templates(self, path):
+        """This method should return a list of paths to templates which are
+        directly used by the template, for example extended or included
+        templates. None should be returned if this can't be established.
+
+        path: relative path to the template.
+        """
+        return None
+
+    def resolve(self, path):
+        """Returns the relative path to the template which will be used to
+        render the file.
+
+        path: path of a source file relative to the source directory.
+        """
+        if not path in self._resolved:
+            names = self.template_names()
+            for template_path in self._template_name_generator(path):
+                if template_path in names:
+                    self._resolved[path] = template_path
+                    break
+            else:
+                raise TemplateRenderException('Could not render %s. No templates.' % path)
+        return self._resolved[path]
+
+    def dependencies(self, path):
+        """Returns a set of paths to all templates which may affect the
+        rendering of the file. This includes the templates which would be used
+        instead if they existed as well as all templates used by the selected
+        template. If that can't be established all templates are returned.
+
+        path: path of a source file relative to the source directory.
+        """
+        if not path in self._dependencies:
+            self._dependencies[path] = self._find_dependencies(path)
+        return self._dependencies[path]
+
+    def _find_dependencies(self, path):
+        template_path = self.resolve(path)
+        dependencies = set()
+        for candidate in self._template_name_generator(path):
+            dependencies.add(candidate)
+            if candidate == template_path:
+                break
+
+        stack = [template_path]
+        while stack:
+            referenced = self._referenced_templates(stack.pop())
+            if referenced is None:
+                dependencies.update(self.template_names())
+                break
+            for name in referenced:
+                if not name in dependencies:
+                    dependencies.add(name)
+                    stack.append(name)
+        return frozenset(os.path.join(self.template_directory, name) for name in dependencies)
+
     def render(self, path, context):
         """Called during the build to render templates.
 
         path: path of a source file relative to the source directory.
         context: see _render_template.
         """
-        for template_path in self._template_name_generator(path):
-            if template_path in self.env.list_templates():
-                return self._render_template(template_path, context)
-        raise TemplateRenderException('Could not render %s. No templates.' % path)
+        return self._render_template(self.resolve(path), context)
 
 
 class Jinja2Templates(BaseTemplates):
-    """Jinja2 templates."""
+    """Jinja2 templates.
+
+    bytecode_storage: a CacheStorage in which compiled templates are stored
+                      so that they don't have to be compiled again by other
+                      processes, see create_bytecode_cache. The entries are
+                      validated using the source of the templates.
+    auto_reload: if False Jinja2 doesn't check if a template changed each time
+                 it is used, the templates have to be invalidated instead.
+    """
 
     def __init__(self, *args, **kwargs):
         extensions = kwargs.pop('extensions', [])
+        bytecode_storage = kwargs.pop('bytecode_storage', None)
+        auto_reload = kwargs.pop('auto_reload', True)
         super(Jinja2Templates, self).__init__(*args, **kwargs)
         import jinja2
         loader = jinja2.FileSystemLoader(self.template_directory)
-        self.env = jinja2.Environment(loader=loader, extensions=extensions)
+        bytecode_cache = None
+        if bytecode_storage is not None:
+            bytecode_cache = create_bytecode_cache(bytecode_storage)
+        self.env = jinja2.Environment(loader=loader, extensions=extensions,
+                                      bytecode_cache=bytecode_cache,
+                                      auto_reload=auto_reload)
 
-    def list_templates(self):
-        return [os.path.join(self.template_directory, path) for path in self.env.list_templates()]
+    def invalidate(self):
+        super(Jinja2Templates, self).invalidate()
+
+        # Compiled templates are cached by the environment.
+        if hasattr(self, 'env') and self.env.cache is not None:
+            self.env.cache.clear()
+
+        # Templates referenced by each template keyed by path, see
+        # _referenced_templates.
+        self._references = {}
+
+    def _list_template_names(self):
+        return self.env.list_templates()
+
+    def _referenced_templates(self, path):
+        import jinja2.meta
+        if not path in self._references:
+            source = self.env.loader.get_source(self.env, path)[0]
+            referenced = list(jinja2.meta.find_referenced_templates(self.env.parse(source)))
+            if None in referenced:
+                referenced = None
+            self._references[path] = referenced
+        return self._references[path]
 
     def _render_template(self, path, context):
         template = self.env.get_template(path)
@@ -118,3 +234,26 @@ class InternationalizedJinja2Templates(Jinja2Templates):
             from babel.core import Locale
             self._locale = Locale.parse(self.locale)
         return self._locale
+
+
+def create_bytecode_cache(storage):
+    """Returns a Jinja2 bytecode cache which stores the compiled templates in
+    a CacheStorage so that they count towards its size limit and are removed
+    together with the least recently used outputs.
+    """
+    import jinja2
+
+    class StorageBytecodeCache(jinja2.BytecodeCache):
+
+        def key(self, bucket):
+            return hashlib.sha256(b'jinja2:' + bucket.key.encode('utf-8')).digest()
+
+        def load_bytecode(self, bucket):
+            data = storage.read(self.key(bucket))
+            if data is not None:
+                bucket.bytecode_from_string(data)
+
+        def dump_bytecode(self, bucket):
+            storage.write(self.key(bucket), bucket.bytecode_to_string())
+
+    return StorageBytecodeCache()
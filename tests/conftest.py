@@ -1,4 +1,7 @@
 import pytest
+from basilisk.cache import Cache
+from basilisk.fingerprint import Fingerprinter
+from basilisk.sources import SourceStore
 
 
 source_directory = 'source_directory'
@@ -14,14 +17,32 @@ class MockBuilder(object):
         }
         self.source_directory = source_directory
         self.output_directory = output_directory
+        self.sources = SourceStore(source_directory)
+        self.build_cache = Cache(self.config, source_directory, output_directory,
+                                 self.sources, Fingerprinter())
         self.builds = []
-        self.builds_modified = False
 
     def add_build(self, build):
-        self.builds_modified = True
         self.builds.append(build)
 
+    def process_builds(self, module, module_config):
+        """Runs a global module like Builder.process_builds."""
+        processed = 0
+        while processed < len(self.builds):
+            builds = self.builds[processed:]
+            processed = len(self.builds)
+            module.process(builds, module_config)
+        module.finish(self.builds, module_config)
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    """Makes the tests use a temporary cache directory, see
+    basilisk.cache.cache_directory.
+    """
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'user-cache'))
+
 
 @pytest.fixture
-def builder():
+def builder(cache_directory):
     return MockBuilder()
@@ -39,9 +39,7 @@ def test_preprocessing_and_postprocessing(builder):
     }
 
     module = BlogModule(builder)
-    while builder.builds_modified:
-        builder.builds_modified = False
-        module.process(iter(builder.builds), module_config)
+    builder.process_builds(module, module_config)
 
     assert len(builder.builds) == len(build_paths) + len(expected_dummy_builds)
 
@@ -82,3 +80,51 @@ def test_preprocessing_and_postprocessing(builder):
     for expected_listing in expected_listings:
         entry = find_listing(expected_listing, listing)
         assert entry is not None
+
+
+def test_pagination(builder):
+    for day in range(1, 6):
+        path = 'blog_name/2019/02/{:02d}/index.html'.format(day)
+        build = Build(path, path)
+        def read(*args, day=day, **kwargs):
+            return 'title: Article {}'.format(day).encode()
+        build.read = read
+        builder.add_build(build)
+    index = Build('blog_name/index.html', 'blog_name/index.html')
+    index.read = lambda *args, **kwargs: b''
+    builder.add_build(index)
+
+    module_config = {
+        'directories': [
+            {
+                'name': 'blog_name',
+                'directory': 'blog_name/',
+                'per_page': 2,
+            }
+        ]
+    }
+
+    module = BlogModule(builder)
+    builder.process_builds(module, module_config)
+
+    listing = index.additional_context['blog']['blog_name']['listing']
+    assert [entry['parameters']['title'] for entry in listing] == [
+        'Article 5', 'Article 4', 'Article 3', 'Article 2', 'Article 1',
+    ]
+
+    tree = index.additional_context['blog']['blog_name']['tree']
+    assert list(tree['2019']['02']) == ['01', '02', '03', '04', '05']
+
+    page = index.additional_context['blog']['blog_name']['page']
+    assert page['number'] == 1
+    assert page['count'] == 3
+    assert page['entries'] == listing[:2]
+    assert page['previous'] is None
+    assert page['next'] == 'page/2'
+
+    pages = {b.output_path: b for b in builder.builds if b.output_path.startswith('blog_name/page/')}
+    assert sorted(pages) == ['blog_name/page/2/index.html', 'blog_name/page/3/index.html']
+    page = pages['blog_name/page/3/index.html'].additional_context['blog']['blog_name']['page']
+    assert page['entries'] == listing[4:]
+    assert page['previous'] == 'page/2'
+    assert page['next'] is None
@@ -0,0 +1,118 @@
+import os
+import json
+import pickle
+from basilisk.modules.listing import ListingModule, Listing
+from basilisk.fingerprint import Fingerprinter
+from basilisk.build import Build
+
+
+def create_listing():
+    listing = Listing()
+    listing.add('index.html', {'title': 'Index'})
+    listing.add(os.path.join('about', 'index.html'), {'title': 'About'})
+    listing.add(os.path.join('articles', 'b.html'), {'date': '2019-02-05'})
+    listing.add(os.path.join('articles', 'a.html'), {'date': '2019-02-04'})
+    listing.add(os.path.join('articles', '2019', 'c.html'), {'date': '2019-02-06'})
+    return listing
+
+
+def test_process(builder):
+    for path in ['index.html', os.path.join('about', 'index.html')]:
+        build = Build(path, path)
+        build.read = lambda *args, **kwargs: b'title: Title\n\nbody'
+        builder.add_build(build)
+
+    module = ListingModule(builder)
+    module.process(builder.builds, {})
+
+    index, about = builder.builds
+    listing = index.additional_context['listing']
+    assert about.additional_context['listing'] is listing
+    assert index.additional_context['current_listing'] == listing
+    assert dict(about.additional_context['current_listing']) == {
+        'index.html': {
+            'type': 'file',
+            'name': 'index.html',
+            'path': os.path.join('about', 'index.html'),
+            'parameters': {'title': 'Title'},
+        }
+    }
+    assert listing['about']['type'] == 'directory'
+    assert listing['about']['content'] is about.additional_context['current_listing']
+
+
+def test_queries():
+    listing = create_listing()
+    assert [n['name'] for n in listing.children()] == ['index.html', 'about', 'articles']
+    assert [n['name'] for n in listing.children('articles')] == ['b.html', 'a.html', '2019']
+    assert listing.children('missing') == []
+    assert listing.get('about/index.html')['parameters'] == {'title': 'About'}
+    assert listing.get('articles')['type'] == 'directory'
+    assert listing.get('missing') is None
+
+    articles = listing.glob('articles/*', sort='date', reverse=True, limit=2)
+    assert [n['name'] for n in articles] == ['c.html', 'b.html']
+    assert [n['name'] for n in listing.glob('articles/*.html')] == ['c.html', 'a.html', 'b.html']
+    assert [n['name'] for n in listing.glob('*/index.html')] == ['index.html']
+
+
+def test_fingerprint():
+    fingerprints = Fingerprinter()
+    listing = create_listing()
+    digest = fingerprints.digest(listing)
+    assert fingerprints.digest(create_listing()) == digest
+    assert fingerprints.digest(listing.directory('articles')) != digest
+
+    changed = create_listing()
+    changed.add('new.html', {})
+    assert Fingerprinter().digest(changed) != digest
+
+
+def test_pickling():
+    listing = create_listing()
+    listing.glob('articles/*')
+    listing = pickle.loads(pickle.dumps(listing))
+    assert listing['articles']['content']['a.html']['parameters'] == {'date': '2019-02-04'}
+
+
+def test_process_added_builds(builder):
+    module = ListingModule(builder)
+    b = Build('b.html', 'b.html')
+    b.read = lambda *args, **kwargs: b''
+    module.process([b], {})
+    listing = b.additional_context['listing']
+    assert list(listing) == ['b.html']
+
+    a = Build('a.html', 'a.html')
+    a.read = lambda *args, **kwargs: b''
+    module.process([a], {})
+    assert a.additional_context['listing'] is listing
+    assert list(listing) == ['b.html', 'a.html']
+
+
+def test_json():
+    listing = Listing()
+    listing.add(os.path.join('about', 'index.html'), {'title': 'About'})
+    listing.add('index.html', {'title': 'Index'})
+    assert json.loads(json.dumps(listing)) == {
+        'about': {
+            'type': 'directory',
+            'name': 'about',
+            'path': 'about',
+            'content': {
+                'index.html': {
+                    'type': 'file',
+                    'name': 'index.html',
+                    'path': os.path.join('about', 'index.html'),
+                    'parameters': {'title': 'About'},
+                },
+            },
+        },
+        'index.html': {
+            'type': 'file',
+            'name': 'index.html',
+            'path': 'index.html',
+            'parameters': {'title': 'Index'},
+        },
+    }
+    assert list(listing) == ['about', 'index.html']
@@ -6,7 +6,7 @@ from basilisk.build import Build
 
 def test_no_config(builder):
     module = ScriptingModule(builder)
-    module.process(None, None)
+    module.finish(None, None)
 
 
 def test_command(builder):
@@ -14,7 +14,7 @@ def test_command(builder):
         'scripts': ['echo testing']
     }
     module = ScriptingModule(builder)
-    module.process(None, module_config)
+    module.finish(None, module_config)
 
 
 def test_invalid_command(builder):
@@ -23,7 +23,7 @@ def test_invalid_command(builder):
     }
     module = ScriptingModule(builder)
     with pytest.raises(subprocess.CalledProcessError):
-        module.process(None, module_config)
+        module.finish(None, module_config)
 
 
 def test_replacement(builder):
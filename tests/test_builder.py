@@ -0,0 +1,64 @@
+import os
+import shutil
+import pytest
+from basilisk.build import Build
+from basilisk.builder import Builder
+
+
+example_directory = os.path.join(os.path.dirname(__file__), '..', 'examples', 'basic')
+
+
+def run_builder(source_directory, output_directory):
+    """Runs a builder and returns a dictionary with the lists of the output
+    paths of the builds which were up to date, restored from the cache and
+    executed.
+    """
+    builder = Builder(source_directory, output_directory)
+    results = {'up_to_date': [], 'cached': [], 'built': []}
+
+    execute = Build.execute
+    restore = builder.build_cache.restore
+
+    def spy_execute(build, *args, **kwargs):
+        results['built'].append(build.output_path)
+        return execute(build, *args, **kwargs)
+
+    def spy_restore(key, build):
+        restored = restore(key, build)
+        if restored:
+            results['cached'].append(build.output_path)
+        return restored
+
+    builder.build_cache.restore = spy_restore
+    Build.execute = spy_execute
+    try:
+        builder.run()
+    finally:
+        Build.execute = execute
+    results['up_to_date'] = [
+        path for path in builder.manifest.current
+        if not path in results['cached'] and not path in results['built']
+    ]
+    return results
+
+
+def test_cached_outputs_are_up_to_date_during_the_next_run(tmp_path):
+    source_directory = str(tmp_path / 'src')
+    shutil.copytree(example_directory, source_directory)
+
+    results = run_builder(source_directory, str(tmp_path / 'a'))
+    assert results['built'] and not results['cached']
+
+    results = run_builder(source_directory, str(tmp_path / 'b'))
+    assert results['cached'] and not results['built']
+
+    results = run_builder(source_directory, str(tmp_path / 'b'))
+    assert results['up_to_date'] and not results['cached'] and not results['built']
+
+
+def test_invalid_module_jobs(tmp_path):
+    source_directory = tmp_path / 'src'
+    source_directory.mkdir()
+    (source_directory / '_config.json').write_text('{"module_jobs": {"resize": 0}}')
+    with pytest.raises(ValueError):
+        Builder(str(source_directory), str(tmp_path / 'out'))
@@ -0,0 +1,231 @@
+import os
+import threading
+import http.server
+from basilisk.build import Build
+from basilisk.cache import Cache, CacheStorage, remove_legacy_entries
+from basilisk.fingerprint import Fingerprinter
+from basilisk.outputs import MemoryOutputs
+from basilisk.sources import SourceStore
+
+
+def write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_put_and_materialize(tmp_path):
+    storage = CacheStorage(str(tmp_path / 'cache'))
+    write(str(tmp_path / 'a'), b'content')
+
+    target = str(tmp_path / 'out' / 'a')
+    assert not storage.materialize(b'\x01' * 32, target)
+    storage.put(b'\x01' * 32, str(tmp_path / 'a'))
+    assert storage.materialize(b'\x01' * 32, target)
+    assert read(target) == b'content'
+
+    # The stored file is a copy.
+    write(target, b'changed')
+    assert storage.materialize(b'\x01' * 32, target)
+    assert read(target) == b'content'
+
+    assert os.path.isfile(os.path.join(str(tmp_path / 'cache'), '01', '01' * 31))
+    stats = storage.stats()
+    assert stats['entries'] == 1
+    assert stats['size'] == len(b'content')
+    assert stats['hits'] == 2
+
+
+def test_prune_removes_least_recently_used(tmp_path):
+    storage = CacheStorage(str(tmp_path / 'cache'), max_size=20)
+    write(str(tmp_path / 'a'), b'0123456789')
+    keys = [bytes([i]) * 32 for i in range(3)]
+    for key in keys:
+        storage.put(key, str(tmp_path / 'a'))
+    storage.materialize(keys[0], str(tmp_path / 'b'))
+    storage.cleanup()
+
+    assert os.path.isfile(storage.path(keys[0]))
+    assert not os.path.isfile(storage.path(keys[1]))
+    assert os.path.isfile(storage.path(keys[2]))
+    assert storage.stats()['size'] == 20
+
+    assert storage.prune(0) == (2, 20)
+    assert storage.stats()['entries'] == 0
+
+
+def make_cache(tmp_path, name, remote_cache):
+    source_directory = tmp_path / name / 'src'
+    output_directory = tmp_path / name / 'out'
+    source_directory.mkdir(parents=True)
+    write(str(source_directory / 'page.html'), b'content')
+    config = {'remote_cache': remote_cache}
+    sources = SourceStore(str(source_directory))
+    cache = Cache(config, str(source_directory), str(output_directory), sources,
+                  Fingerprinter())
+    cache.storage = CacheStorage(str(tmp_path / name / 'cache'))
+    return cache
+
+
+def check_remote_cache(tmp_path, remote_cache):
+    build = Build('page.html', 'page/index.html')
+
+    # Keys don't depend on the location of the source directory.
+    a = make_cache(tmp_path, 'a', remote_cache)
+    key = a.get_key(build)
+    assert not a.restore(key, build)
+    build.write(a.output_directory, b'output')
+    build.dependencies.add(os.path.join('templates', 'page.html'))
+    a.put(key, build)
+
+    b = make_cache(tmp_path, 'b', remote_cache)
+    assert b.get_key(build) == key
+    assert b.restore(key, build)
+    assert read(os.path.join(b.output_directory, 'page', 'index.html')) == b'output'
+
+    # Retrieved outputs are added to the local cache.
+    assert os.path.isfile(b.storage.path(key))
+
+    assert b.get_dependencies(key) == {os.path.join('templates', 'page.html')}
+
+
+def test_directory_remote_cache(tmp_path):
+    check_remote_cache(tmp_path, str(tmp_path / 'remote'))
+
+
+def test_execution_keys_dont_change_key(tmp_path):
+    build = Build('page.html', 'page/index.html')
+    cache = make_cache(tmp_path, 'a', None)
+    key = cache.get_key(build)
+    cache = Cache({'jobs': 6, 'executor': 'process'}, cache.source_directory,
+                  cache.output_directory, cache.sources, Fingerprinter())
+    assert cache.get_key(build) == key
+
+
+def test_restore_memory_outputs(tmp_path):
+    build = Build('page.html', 'page/index.html')
+    cache = make_cache(tmp_path, 'a', None)
+    key = cache.get_key(build)
+    build.write(cache.output_directory, b'output')
+    cache.put(key, build)
+
+    cache.outputs = MemoryOutputs(cache.output_directory)
+    assert cache.restore(key, build)
+    assert cache.outputs.get('page/index.html').content == b'output'
+
+    build = Build('other.html', 'other.html')
+    cache.outputs.write(build.output_path, b'other')
+    cache.put(b'\x02' * 32, build)
+    assert read(cache.storage.path(b'\x02' * 32)) == b'other'
+
+
+def test_http_remote_cache(tmp_path):
+    entries = {}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if not self.path in entries:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(entries[self.path])
+
+        def do_PUT(self):
+            length = int(self.headers['Content-Length'])
+            entries[self.path] = self.rfile.read(length)
+            self.send_response(201)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        check_remote_cache(tmp_path, 'http://127.0.0.1:%d/cache/' % server.server_port)
+    finally:
+        server.shutdown()
+        thread.join()
+    # The output and its dependencies.
+    assert len(entries) == 2
+
+
+def test_process_memoizes_processors_with_identity(tmp_path):
+    cache = make_cache(tmp_path, 'a', None)
+    calls = []
+
+    def processor(content, context):
+        calls.append(content)
+        return content.upper()
+
+    assert cache.process(processor, b'a', {}) == b'A'
+    assert cache.process(processor, b'a', {}) == b'A'
+    assert len(calls) == 2
+
+    processor.cache_identity = ('upper', 1)
+    assert cache.process(processor, b'a', {}) == b'A'
+    assert cache.process(processor, b'a', {}) == b'A'
+    assert cache.process(processor, b'b', {}) == b'B'
+    assert len(calls) == 4
+
+    processor.cache_identity = ('upper', 2)
+    assert cache.process(processor, b'a', {}) == b'A'
+    assert len(calls) == 5
+
+
+def test_last_processor_is_not_memoized(tmp_path):
+    cache = make_cache(tmp_path, 'a', None)
+    memoized = []
+    process = cache.process
+
+    def spy_process(processor, content, context):
+        memoized.append(processor)
+        return process(processor, content, context)
+    cache.process = spy_process
+
+    def upper(content, context):
+        return content.upper()
+    upper.cache_identity = 'upper'
+
+    def reverse(content, context):
+        return content[::-1]
+    reverse.cache_identity = 'reverse'
+
+    build = Build('page.html', 'page.html')
+    build.processors = [upper, reverse]
+    build.execute({}, cache.source_directory, cache.output_directory, cache.sources, cache)
+    assert read(os.path.join(cache.output_directory, 'page.html')) == b'TNETNOC'
+    assert memoized == [upper]
+
+
+def test_process_keeps_result_type(tmp_path):
+    cache = make_cache(tmp_path, 'a', None)
+
+    def processor(content, context):
+        return content.upper()
+    processor.cache_identity = 'upper'
+
+    assert cache.process(processor, 'a', {}) == 'A'
+    assert cache.process(processor, 'a', {}) == 'A'
+    assert cache.process(processor, b'a', {}) == b'A'
+    assert cache.process(processor, b'a', {}) == b'A'
+
+
+def test_remove_legacy_entries(tmp_path):
+    legacy = tmp_path / ('ab' * 32)
+    legacy.write_bytes(b'output')
+    (tmp_path / 'outputs').mkdir()
+    remove_legacy_entries(str(tmp_path))
+    assert sorted(os.listdir(str(tmp_path))) == ['.legacy-entries-removed', 'outputs']
+
+    # The directory is listed only once.
+    legacy.write_bytes(b'output')
+    remove_legacy_entries(str(tmp_path))
+    assert legacy.exists()
@@ -0,0 +1,46 @@
+from basilisk.build import Build
+from basilisk.content import Content, text_processor
+
+
+def test_conversions():
+    content = Content(b'<p>\xc5\xbc</p>')
+    assert content.get('text') == '<p>ż</p>'
+    dom = content.get('dom')
+    dom.p['class'] = 'a'
+    assert content.get('text') == '<p class="a">ż</p>'
+    assert content.get('bytes') == b'<p class="a">\xc5\xbc</p>'
+
+
+def test_text_processor():
+    @text_processor
+    def processor(content, context):
+        return content.upper()
+
+    assert processor.content_type == 'text'
+    assert processor('a', {}) == 'A'
+    assert processor(b'a', {}) == b'A'
+
+
+def test_build_passes_requested_types(tmp_path):
+    (tmp_path / 'page.html').write_bytes(b'content')
+    types = []
+
+    def bytes_processor(content, context):
+        types.append(type(content))
+        return content
+
+    @text_processor
+    def processor(content, context):
+        types.append(type(content))
+        context['shared'] = True
+        return content
+
+    def check_context(content, context):
+        assert context['shared']
+        return content
+
+    build = Build('page.html', 'page.html')
+    build.processors = [processor, processor, check_context, bytes_processor]
+    build.execute({}, str(tmp_path), str(tmp_path / 'out'))
+    assert types == [str, str, bytes]
+    assert (tmp_path / 'out' / 'page.html').read_bytes() == b'content'
@@ -0,0 +1,49 @@
+from basilisk.build import Build
+from basilisk.dom import HtmlStage
+from basilisk.modules.list_headers import ListHeadersModule
+from basilisk.modules.lazy_load_images import LazyLoadImagesModule
+from basilisk.modules.markdown import MarkdownModule
+
+
+html = b'<h1>Title</h1><p><img src="a.png"></p><h2>Section</h2>'
+
+
+def test_consecutive_modules_share_stage(builder):
+    build = Build('page.html', 'page.html')
+    ListHeadersModule(builder).execute(build, None)
+    LazyLoadImagesModule(builder).execute(build, None)
+    assert len(build.processors) == 1
+    assert isinstance(build.processors[0], HtmlStage)
+
+    context = {}
+    content = str(build.processors[0](html.decode(), context))
+    assert 'loading="lazy"' in content
+    assert 'id="0-title"' in content
+    assert context['headers'] is build.additional_context['headers']
+    assert build.additional_context['headers']['list'] == [
+        {'name': 'h1', 'id': '0-title', 'string': 'Title'},
+        {'name': 'h2', 'id': '1-section', 'string': 'Section'},
+    ]
+
+
+def test_separated_modules_use_separate_stages(builder):
+    build = Build('page.md', 'page.md')
+    ListHeadersModule(builder).execute(build, None)
+    MarkdownModule(builder).execute(build, None)
+    LazyLoadImagesModule(builder).execute(build, None)
+    assert len(build.processors) == 3
+
+
+def test_unmodified_content_is_returned(builder):
+    build = Build('page.html', 'page.html')
+    ListHeadersModule(builder).execute(build, None)
+    content = '<p>No headers<br></p>'
+    assert build.processors[0](content, {}) is content
+    assert build.additional_context['headers'] == {'list': []}
+
+
+def test_lazy_images_are_not_modified(builder):
+    build = Build('page.html', 'page.html')
+    LazyLoadImagesModule(builder).execute(build, None)
+    content = '<p><img loading="lazy" src="a.png"></p>'
+    assert build.processors[0](content, {}) is content
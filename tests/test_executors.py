@@ -0,0 +1,48 @@
+import io
+import pickle
+from basilisk.build import Build
+from basilisk.executors import find_shared_objects, SharedObjectsPickler, \
+    SharedObjectsUnpickler, ThreadExecutor, ProcessExecutor
+
+
+def test_find_shared_objects():
+    listing = {'index.html': {'type': 'file'}}
+    a = Build('a.md', 'a.md')
+    a.additional_context['listing'] = listing
+    a.additional_context['unique'] = {}
+    b = Build('b.md', 'b.md')
+    b.additional_context['listing'] = listing
+    shared = find_shared_objects([a, b])
+    assert list(shared.values()) == [listing]
+
+
+def test_build_pickling_drops_closures():
+    build = Build('a.md', 'a.md')
+    build.processors.append(lambda content, context: content)
+    build.read = lambda path: b''
+    build = pickle.loads(pickle.dumps(build))
+    assert build.processors == []
+    assert build.read.__func__ is Build.read
+
+
+def test_shared_objects_pickling():
+    listing = {'index.html': {'type': 'file'}}
+    build = Build('a.md', 'a.md')
+    build.additional_context['listing'] = listing
+
+    f = io.BytesIO()
+    SharedObjectsPickler(f, {id(listing): 0}).dump(build)
+    f.seek(0)
+    build = SharedObjectsUnpickler(f, [listing]).load()
+    assert build.additional_context['listing'] is listing
+
+
+def test_process_executor_threads(monkeypatch):
+    # Each build executed by a worker process blocks a thread of the pool.
+    monkeypatch.setattr('os.cpu_count', lambda: 64)
+    executor = ProcessExecutor(None)
+    ThreadExecutor.__enter__(executor)
+    try:
+        assert executor.pool._max_workers == executor.workers == 64
+    finally:
+        ThreadExecutor.__exit__(executor)
@@ -0,0 +1,47 @@
+from basilisk.fingerprint import Fingerprinter
+
+
+def test_digest_is_structural():
+    fingerprints = Fingerprinter()
+    a = {'listing': {'a': [1, 'b', None]}, 'title': 'Title'}
+    b = {'listing': {'a': [1, 'b', None]}, 'title': 'Title'}
+    assert fingerprints.digest(a) == fingerprints.digest(b)
+    assert fingerprints.digest(a) != fingerprints.digest({'listing': {'a': [1, 'b']}})
+    assert fingerprints.digest([1]) != fingerprints.digest(['1'])
+    assert fingerprints.digest(['ab', 'c']) != fingerprints.digest(['a', 'bc'])
+
+
+def test_digest_context_ignores_key_order():
+    fingerprints = Fingerprinter()
+    a = {'a': 1, 'b': 2}
+    b = {'b': 2, 'a': 1}
+    assert fingerprints.digest_context(a) == fingerprints.digest_context(b)
+    assert fingerprints.digest_context(a, ['b']) == fingerprints.digest_context({'a': 1})
+
+
+def test_shared_objects_are_remembered():
+    fingerprints = Fingerprinter()
+    listing = {'a': {'type': 'file'}}
+    digest = fingerprints.digest_context({'listing': listing})
+
+    # Until the fingerprinter is cleared the shared object is not hashed
+    # again.
+    listing['b'] = {'type': 'file'}
+    assert fingerprints.digest_context({'listing': listing}) == digest
+
+    fingerprints.clear()
+    assert fingerprints.digest_context({'listing': listing}) != digest
+
+
+def test_custom_fingerprint():
+    class Obj(object):
+
+        def __init__(self, value):
+            self.value = value
+
+        def __fingerprint__(self):
+            return self.value.encode()
+
+    fingerprints = Fingerprinter()
+    assert fingerprints.digest(Obj('a')) != fingerprints.digest(Obj('b'))
+    assert fingerprints.digest([Obj('a')]) == Fingerprinter().digest([Obj('a')])
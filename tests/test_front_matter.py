@@ -0,0 +1,103 @@
+import random
+import pytest
+from basilisk.build import Build
+from basilisk import front_matter
+
+
+def extract_parameters(content):
+    """The implementation of Build.extract_parameters which was replaced by
+    front_matter.parse.
+    """
+    try:
+        lines = content.decode().splitlines(True)
+    except UnicodeDecodeError:
+        return content, {}
+
+    parameters = {}
+    remaining_content = ''
+    for line in lines:
+        if not remaining_content:
+            parameter = Build(None, None).read_parameter(line)
+            if parameter:
+                parameters.update(parameter)
+                continue
+        remaining_content += line
+
+    if remaining_content.startswith('\r\n'):
+        remaining_content = remaining_content[2:]
+    else:
+        if remaining_content.startswith('\n'):
+            remaining_content = remaining_content[1:]
+
+    return (remaining_content.encode(), parameters)
+
+
+cases = [
+    b'',
+    b'\n',
+    b'\r\n',
+    b'title: Title',
+    b'title: Title\n',
+    b'title: Title\n\nContent',
+    b'title: Title\r\n\r\nContent\r\n',
+    b'title: Title\ndate: 2019-01-01\n\n\nContent',
+    b'title: Title\nContent\nkey: value\n',
+    b'Content: with a colon\n\nMore',
+    b'Content\n\ntitle: Title',
+    b'a:b:c\n: empty key\nempty value:\n\nContent',
+    b'  spaced  :  value  \n\nContent',
+    b'title: Title\rdate: Date\r\rContent',
+    b'title: Title\x0bdate: Date\x0c\nContent',
+    b'title: Title\x1c\x1d\x1eContent',
+    'title: Zażółć date: Date \nContent\x85more'.encode(),
+    'tytuł: gęślą jaźń\n\nTreść'.encode(),
+    '﻿title: Title\n\nContent'.encode(),
+    b'title: Title\n\n\x00\x01binary but valid',
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\xff\xfe',
+    b'title: Title\n\n\xff\xfe',
+]
+
+
+@pytest.mark.parametrize('content', cases)
+def test_parity(content):
+    body, parameters = front_matter.parse(content, Build(None, None).read_parameter)
+    expected_body, expected_parameters = extract_parameters(content)
+    assert bytes(body) == expected_body
+    assert parameters == expected_parameters
+
+
+def test_parity_random():
+    rng = random.Random(0)
+    alphabet = ['a', ' ', ':', '\n', '\r', '\r\n', '\x0b', '\x85', ' ', 'ż', '\udcff']
+    for _ in range(2000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        content = text.encode('utf-8', 'surrogatepass')
+        body, parameters = front_matter.parse(content, Build(None, None).read_parameter)
+        expected_body, expected_parameters = extract_parameters(content)
+        assert bytes(body) == expected_body, content
+        assert parameters == expected_parameters, content
+
+
+def test_body_is_not_copied():
+    content = b'title: Title\n\n' + b'x' * 1000
+    body, parameters = Build(None, None).extract_parameters(content)
+    assert isinstance(body, memoryview)
+    assert body.obj is content
+    assert parameters == {'title': 'Title'}
+
+
+def test_binary_is_returned_unchanged():
+    content = b'\xff' + b'title: Title\n' * 10
+    assert front_matter.parse(content, None) == (content, {})
+
+
+def test_is_text_across_chunks():
+    content = b'x' * (front_matter.chunk_size - 1) + 'ż'.encode() + b'x'
+    assert front_matter.is_text(content)
+    assert not front_matter.is_text(content[:front_matter.chunk_size])
+    assert front_matter.is_text(b'\xff' + content, 1)
+
+
+def test_invalid_body_after_parameters():
+    content = b'title: Title\n\n' + b'x' * front_matter.chunk_size + b'\xff'
+    assert front_matter.parse(content, Build(None, None).read_parameter) == (content, {})
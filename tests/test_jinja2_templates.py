@@ -0,0 +1,52 @@
+from basilisk.cache import CacheStorage
+from basilisk.templates import Jinja2Templates
+
+
+def test_resolve(tmp_path):
+    (tmp_path / 'dir').mkdir()
+    (tmp_path / '_base.html').write_text('base')
+    (tmp_path / 'dir' / 'page.html').write_text('{% extends "_base.html" %}')
+    templates = Jinja2Templates(str(tmp_path))
+
+    assert templates.resolve('dir/page.md') == 'dir/page.html'
+    assert templates.resolve('dir/other.md') == '_base.html'
+    assert templates.dependencies('dir/page.md') == {
+        str(tmp_path / 'dir' / 'page.html'),
+        str(tmp_path / '_base.html'),
+    }
+
+
+def test_invalidate(tmp_path):
+    (tmp_path / '_base.html').write_text('base')
+    templates = Jinja2Templates(str(tmp_path))
+    assert templates.resolve('page.md') == '_base.html'
+
+    # The templates are listed only once.
+    (tmp_path / 'page.html').write_text('page')
+    assert templates.resolve('page.md') == '_base.html'
+
+    templates.invalidate()
+    assert templates.resolve('page.md') == 'page.html'
+    assert len(templates.list_templates()) == 2
+
+
+def test_bytecode_cache(tmp_path):
+    (tmp_path / 'templates').mkdir()
+    (tmp_path / 'templates' / '_base.html').write_text('{{ a }}')
+    storage = CacheStorage(str(tmp_path / 'cache'))
+
+    templates = Jinja2Templates(str(tmp_path / 'templates'),
+                                bytecode_storage=storage,
+                                auto_reload=False)
+    assert templates.render('page.md', {'a': 'a'}) == 'a'
+    assert storage.stats()['entries'] == 1
+
+    # Compiled templates are removed together with the outputs.
+    storage.prune(0)
+    assert storage.stats()['entries'] == 0
+
+    # Without auto_reload changes are visible only after invalidating.
+    (tmp_path / 'templates' / '_base.html').write_text('{{ a }}{{ a }}')
+    assert templates.render('page.md', {'a': 'a'}) == 'a'
+    templates.invalidate()
+    assert templates.render('page.md', {'a': 'a'}) == 'aa'
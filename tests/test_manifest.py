@@ -0,0 +1,165 @@
+import os
+from basilisk.build import Build
+from basilisk.manifest import Manifest
+
+
+pipeline = {'patterns': ['*'], 'modules': []}
+
+
+def make_build(source_directory, output_directory):
+    with open(os.path.join(source_directory, 'page.html'), 'wb') as f:
+        f.write(b'content')
+    with open(os.path.join(source_directory, 'template.html'), 'wb') as f:
+        f.write(b'template')
+    build = Build('page.html', 'page/index.html')
+    build.dependencies.add('template.html')
+    build.write(output_directory, b'output')
+    return build
+
+
+def test_up_to_date(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+
+    manifest = Manifest({}, source_directory, output_directory)
+    fingerprint = manifest.fingerprint(build, pipeline)
+    assert not manifest.is_up_to_date(build, fingerprint)
+    manifest.record(build, fingerprint)
+    manifest.save()
+
+    assert Manifest.exists(output_directory)
+    manifest = Manifest({}, source_directory, output_directory)
+    assert manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
+
+
+def test_execution_keys_are_not_fingerprinted(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+
+    manifest = Manifest({'jobs': 5}, source_directory, output_directory)
+    fingerprint = manifest.fingerprint(build, pipeline)
+    manifest = Manifest({'jobs': 6}, source_directory, output_directory)
+    assert manifest.fingerprint(build, dict(pipeline, jobs=2)) == fingerprint
+    manifest = Manifest({'modules': []}, source_directory, output_directory)
+    assert manifest.fingerprint(build, pipeline) != fingerprint
+
+
+def test_dependency_changed(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.record(build, manifest.fingerprint(build, pipeline))
+    manifest.save()
+
+    with open(os.path.join(source_directory, 'template.html'), 'wb') as f:
+        f.write(b'changed')
+    manifest = Manifest({}, source_directory, output_directory)
+    assert not manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
+
+
+def test_unknown_dependencies(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.record(build, manifest.fingerprint(build, pipeline), dependencies=False)
+    manifest.save()
+
+    manifest = Manifest({}, source_directory, output_directory)
+    assert not manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
+
+
+def test_remove_stale_outputs(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.record(build, manifest.fingerprint(build, pipeline))
+    manifest.save()
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.remove_stale_outputs()
+    assert not os.path.exists(os.path.join(output_directory, 'page'))
+    assert os.path.isdir(output_directory)
+
+
+def test_changed_paths(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.record(build, manifest.fingerprint(build, pipeline))
+    manifest.save()
+
+    with open(os.path.join(source_directory, 'page.html'), 'wb') as f:
+        f.write(b'changed')
+
+    manifest = Manifest({}, source_directory, output_directory, set())
+    assert manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
+
+    manifest = Manifest({}, source_directory, output_directory, {'page.html'})
+    assert not manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
+
+
+def test_keep_previous(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.record(build, manifest.fingerprint(build, pipeline))
+    manifest.save()
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.keep_previous()
+    manifest.save()
+
+    manifest = Manifest({}, source_directory, output_directory)
+    assert manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
+
+
+def test_manifest_is_not_stored_in_output_directory(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+    assert not Manifest.exists(output_directory)
+
+    manifest = Manifest({}, source_directory, output_directory)
+    manifest.record(build, manifest.fingerprint(build, pipeline))
+    manifest.save()
+    assert os.listdir(output_directory) == ['page']
+    assert Manifest.exists(output_directory)
+    assert not Manifest.exists(str(tmp_path / 'other'))
+
+    Manifest.remove(output_directory)
+    assert not Manifest.exists(output_directory)
+
+
+def test_trust_mtime(tmp_path):
+    source_directory, output_directory = str(tmp_path / 'src'), str(tmp_path / 'out')
+    os.makedirs(source_directory)
+    build = make_build(source_directory, output_directory)
+    page = os.path.join(source_directory, 'page.html')
+    os.utime(page, ns=(0, 0))
+
+    config = {'trust_mtime': True}
+    manifest = Manifest(config, source_directory, output_directory)
+    manifest.record(build, manifest.fingerprint(build, pipeline))
+    manifest.save()
+
+    # A file replaced with one which has the same size and modification time
+    # is hashed again only if the modification time is not trusted.
+    with open(page, 'wb') as f:
+        f.write(b'changed')
+    os.utime(page, ns=(0, 0))
+    manifest = Manifest(config, source_directory, output_directory, set([build.input_path]))
+    assert manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
+    manifest = Manifest({}, source_directory, output_directory, set([build.input_path]))
+    assert not manifest.is_up_to_date(build, manifest.fingerprint(build, pipeline))
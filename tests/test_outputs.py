@@ -0,0 +1,65 @@
+import os
+import pickle
+from basilisk.outputs import DirectoryOutputs, MemoryOutputs
+
+
+def test_directory_outputs(tmp_path):
+    outputs = DirectoryOutputs(str(tmp_path))
+    outputs.write(os.path.join('a', 'b', 'index.html'), b'content')
+    assert outputs.exists(os.path.join('a', 'b', 'index.html'))
+    assert outputs.read(os.path.join('a', 'b', 'index.html')) == b'content'
+
+    # Directories left empty are removed.
+    outputs.remove(os.path.join('a', 'b', 'index.html'))
+    assert not outputs.exists(os.path.join('a', 'b', 'index.html'))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_memory_outputs(tmp_path):
+    outputs = MemoryOutputs(str(tmp_path))
+    outputs.write(os.path.join('a', 'index.html'), memoryview(b'content'))
+    output = outputs.get('a/./index.html')
+    assert output.content == b'content'
+    assert outputs.file_path(os.path.join('a', 'index.html')) is None
+    assert os.listdir(str(tmp_path)) == []
+
+    # Entity tags change with the content.
+    etag = output.etag
+    outputs.write(os.path.join('a', 'index.html'), b'content')
+    assert outputs.get(os.path.join('a', 'index.html')).etag == etag
+    outputs.write(os.path.join('a', 'index.html'), b'changed')
+    assert outputs.get(os.path.join('a', 'index.html')).etag != etag
+
+    outputs.remove(os.path.join('a', 'index.html'))
+    assert not outputs.exists(os.path.join('a', 'index.html'))
+
+
+def test_memory_outputs_reference_large_files(tmp_path):
+    small = tmp_path / 'small.txt'
+    small.write_bytes(b'small')
+    large = tmp_path / 'large.mp4'
+    large.write_bytes(b'large file')
+
+    outputs = MemoryOutputs(str(tmp_path / 'out'))
+    outputs.reference_size = 10
+    outputs.copy('small.txt', str(small))
+    outputs.copy('large.mp4', str(large))
+    outputs.copy('cached.mp4', str(large), reference=False)
+    assert outputs.get('small.txt').content == b'small'
+    assert outputs.get('large.mp4').path == str(large)
+    assert outputs.get('large.mp4').content is None
+    assert outputs.read('large.mp4') == b'large file'
+    assert outputs.get('cached.mp4').content == b'large file'
+
+
+def test_memory_outputs_pickling(tmp_path):
+    outputs = MemoryOutputs(str(tmp_path))
+    outputs.write('index.html', b'content')
+    worker_outputs = pickle.loads(pickle.dumps(outputs))
+    assert not worker_outputs.exists('index.html')
+
+    # Outputs created by workers are moved to the main process.
+    worker_outputs.write('other.html', b'other')
+    outputs.add('other.html', worker_outputs.take('other.html'))
+    assert not worker_outputs.exists('other.html')
+    assert outputs.read('other.html') == b'other'
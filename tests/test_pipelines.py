@@ -0,0 +1,49 @@
+import fnmatch
+import pytest
+from basilisk.build import Build
+from basilisk.pipelines import Pipelines
+
+
+markdown = {'patterns': ['*.md'], 'modules': [{'name': 'markdown'}]}
+index = {'patterns': ['index.html', 'a/*/b?.html'], 'modules': []}
+other = {'patterns': ['*'], 'modules': []}
+
+
+def test_get():
+    pipelines = Pipelines([markdown, index, other])
+    assert pipelines.get('dir/file.md') is markdown
+    assert pipelines.get('index.html') is index
+    assert pipelines.get('a/x/y/b1.html') is index
+    assert pipelines.get('a/x/b12.html') is other
+    assert Pipelines([markdown]).get('file.html') is None
+
+
+def test_matches_fnmatch():
+    patterns = ['*.md', 'index.html', '*', 'a/*.html', '*[ab].txt', '?.css', '*.*.js']
+    paths = ['file.md', 'dir/file.md', 'index.html', 'dir/index.html',
+             'a/b/c.html', 'a.txt', 'dir/b.txt', 'c.txt', 'x.css', 'xy.css',
+             'min.app.js', 'app.js']
+    for pattern in patterns:
+        pipeline = {'patterns': [pattern], 'modules': []}
+        pipelines = Pipelines([pipeline])
+        for path in paths:
+            expected = pipeline if fnmatch.fnmatch(path, pattern) else None
+            assert pipelines.get(path) is expected, (pattern, path)
+
+
+def test_validate():
+    with pytest.raises(ValueError):
+        Pipelines([{'modules': []}])
+    with pytest.raises(ValueError):
+        Pipelines([{'patterns': ['*'], 'modules': [{'config': {}}]}])
+
+
+def test_group():
+    pipelines = Pipelines([markdown, index, other])
+    builds = [Build(path, path) for path in ['a.html', 'a.md', 'index.html', 'b.md']]
+    groups = pipelines.group(builds)
+    assert [(pipeline, [b.input_path for b in group]) for pipeline, group in groups] == [
+        (markdown, ['a.md', 'b.md']),
+        (index, ['index.html']),
+        (other, ['a.html']),
+    ]
@@ -0,0 +1,42 @@
+import os
+from basilisk.scanner import Scanner
+
+
+def create_files(directory, paths):
+    for path in paths:
+        path = os.path.join(directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write('content')
+
+
+def test_scan(tmp_path):
+    create_files(str(tmp_path), [
+        'index.html',
+        os.path.join('a', 'index.html'),
+        os.path.join('a', 'b', 'c', 'file.md'),
+        os.path.join('d', 'file.md'),
+        os.path.join('_ignored', 'file.md'),
+        os.path.join('d', '_ignored.md'),
+    ])
+    os.symlink(str(tmp_path / 'a'), str(tmp_path / 'link'))
+
+    descended = []
+    def ignore_directory(path):
+        descended.append(path)
+        return os.path.basename(path).startswith('_')
+
+    def ignore_file(path):
+        return os.path.basename(path).startswith('_')
+
+    scanner = Scanner(str(tmp_path), ignore_directory, ignore_file)
+    files = dict(scanner.scan())
+    assert sorted(files) == sorted([
+        'index.html',
+        os.path.join('a', 'index.html'),
+        os.path.join('a', 'b', 'c', 'file.md'),
+        os.path.join('d', 'file.md'),
+    ])
+    assert all(stat.st_size == len('content') for stat in files.values())
+    assert not any(path.startswith('_ignored' + os.sep) for path in descended)
+    assert not 'link' in descended
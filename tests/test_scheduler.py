@@ -0,0 +1,184 @@
+import time
+import threading
+import concurrent.futures
+from basilisk.build import Build
+from basilisk.builder import Builder
+from basilisk.scheduler import Scheduler, DurationIndex
+
+
+video = {'patterns': ['*.mp4'], 'jobs': 2, 'modules': [{'name': 'resize'}]}
+page = {'patterns': ['*.md'], 'modules': [{'name': 'markdown'}]}
+
+
+class MockBuilder(object):
+
+    def __init__(self, config, durations=None):
+        self.config = config
+        self.durations = durations
+
+    def get_pipeline(self, build):
+        return video if build.input_path.endswith('.mp4') else page
+
+
+class MockExecutor(object):
+    """Executes builds in a pool of threads recording the largest number of
+    builds of each pipeline and the largest total cost executed at the same
+    time.
+    """
+
+    workers = 8
+
+    def __init__(self, costs):
+        self.costs = costs
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self.lock = threading.Lock()
+        self.running = []
+        self.max_running = {}
+        self.max_cost = 0
+        self.submitted = []
+
+    def execute(self, build):
+        ext = build.input_path.rsplit('.', 1)[1]
+        with self.lock:
+            self.running.append(build)
+            count = sum(1 for b in self.running if b.input_path.endswith(ext))
+            self.max_running[ext] = max(self.max_running.get(ext, 0), count)
+            cost = sum(self.costs[b.input_path] for b in self.running)
+            self.max_cost = max(self.max_cost, cost)
+        time.sleep(0.01)
+        with self.lock:
+            self.running.remove(build)
+
+    def submit(self, build):
+        self.submitted.append(build.input_path)
+        return self.pool.submit(self.execute, build)
+
+
+def run(config, builds, costs, durations=None):
+    executor = MockExecutor(costs)
+    scheduler = Scheduler(MockBuilder(config, durations), executor)
+    scheduler.cost = lambda build: costs[build.input_path]
+    futures = list(scheduler.run(builds))
+    for future in futures:
+        future.result()
+    assert len(futures) == len(builds)
+    return executor
+
+
+def test_pipeline_jobs():
+    builds = [Build('%d.mp4' % i, '%d.mp4' % i) for i in range(6)] + \
+        [Build('%d.md' % i, '%d.md' % i) for i in range(20)]
+    costs = {b.input_path: 1 for b in builds}
+    executor = run({}, builds, costs)
+    assert executor.max_running['mp4'] == 2
+    assert executor.max_running['md'] > 2
+
+
+def test_module_jobs():
+    builds = [Build('%d.md' % i, '%d.md' % i) for i in range(10)]
+    costs = {b.input_path: 1 for b in builds}
+    executor = run({'module_jobs': {'markdown': 3}}, builds, costs)
+    assert executor.max_running['md'] == 3
+
+
+def test_memory_budget():
+    builds = [Build('%d.md' % i, '%d.md' % i) for i in range(10)]
+    costs = {b.input_path: 10 for b in builds}
+    costs['0.md'] = 100
+    executor = run({'memory_budget': 30}, builds, costs)
+    assert executor.max_cost == 100
+    executor = run({'memory_budget': 30}, builds[1:], costs)
+    assert executor.max_cost == 30
+
+
+def test_durations(tmp_path):
+    path = str(tmp_path / 'durations.sqlite')
+    durations = DurationIndex(path, 'source_directory')
+    a = Build('a.md', 'a.html')
+    b = Build('b.md', 'b.html')
+    durations.record(a, 2.0, 100)
+    durations.save()
+
+    durations = DurationIndex(path, 'source_directory')
+    assert durations.expected(a, 0) == 2.0
+    assert durations.expected(b, 50) == 1.0
+    assert DurationIndex(path, 'source_directory').expected(Build('a.md', 'other.html'), 0) == 0
+    assert DurationIndex(path, 'other_directory').expected(a, 0) == 0
+
+
+def test_durations_are_reused_by_other_output_directories(tmp_path):
+    source_directory = tmp_path / 'src'
+    source_directory.mkdir()
+    (source_directory / 'a.html').write_bytes(b'content')
+    build = Build('a.html', 'a.html')
+
+    builder = Builder(str(source_directory), str(tmp_path / 'a'))
+    builder.durations.record(build, 5.0, 7)
+    builder.durations.save()
+
+    builder = Builder(str(source_directory), str(tmp_path / 'b'))
+    assert builder.durations.expected(build, 7) == 5.0
+
+
+def test_durations_are_pruned(tmp_path):
+    path = str(tmp_path / 'durations.sqlite')
+    a = Build('a.md', 'a.html')
+    b = Build('b.md', 'b.html')
+    durations = DurationIndex(path, 'source_directory')
+    durations.record(a, 1.0, 100)
+    durations.record(b, 2.0, 100)
+    durations.save()
+
+    durations = DurationIndex(path, 'source_directory')
+    durations.max_age = 0.5
+    durations.expected(a, 0)
+    time.sleep(1)
+    durations.save()
+    durations = DurationIndex(path, 'source_directory')
+    assert durations.expected(a, 0) == 1.0
+    assert durations.expected(b, 0) == 0
+
+
+def test_longest_builds_first(tmp_path):
+    durations = DurationIndex(str(tmp_path / 'durations.sqlite'), 'source_directory')
+    builds = [Build('%d.md' % i, '%d.md' % i) for i in range(4)]
+    durations.record(builds[1], 10.0, 1000)
+    durations.save()
+    costs = {'0.md': 1, '1.md': 1, '2.md': 500, '3.md': 2}
+    executor = run({}, builds, costs, durations)
+    assert executor.submitted == ['1.md', '2.md', '3.md', '0.md']
+
+
+def test_prioritize():
+    builds = [Build('%d.md' % i, '%d.md' % i) for i in range(20)]
+    costs = {b.input_path: 1 for b in builds}
+    executor = MockExecutor(costs)
+    executor.workers = 1
+    scheduler = Scheduler(MockBuilder({}), executor)
+    scheduler.cost = lambda build: costs[build.input_path]
+
+    futures = scheduler.run(builds)
+    next(futures)
+    waiter = scheduler.prioritize('19.md')
+    assert scheduler.prioritize('missing.md') is None
+    for future in futures:
+        pass
+    assert waiter.done()
+    assert executor.submitted.index('19.md') < 5
+
+
+def test_cancel():
+    builds = [Build('%d.md' % i, '%d.md' % i) for i in range(20)]
+    costs = {b.input_path: 1 for b in builds}
+    executor = MockExecutor(costs)
+    executor.workers = 1
+    scheduler = Scheduler(MockBuilder({}), executor)
+    scheduler.cost = lambda build: costs[build.input_path]
+
+    futures = scheduler.run(builds)
+    next(futures)
+    scheduler.cancel()
+    assert scheduler.prioritize('19.md') is None
+    remaining = list(futures)
+    assert len(remaining) < len(builds) - 1
+    assert all(future.done() for future in remaining)
@@ -0,0 +1,96 @@
+import os
+import threading
+from basilisk.exceptions import BuildCancelled
+from basilisk.outputs import MemoryOutputs
+from basilisk.server import Server, create_app
+
+
+class MockBuilder(object):
+    """Writes the content to index.html in the output directory when it is
+    run. Runs are cancelled as long as cancelled is set.
+    """
+
+    def __init__(self, output_directory):
+        self.output_directory = output_directory
+        self.content = b'<body>fresh</body>'
+        self.cancelled = False
+        self.done = threading.Event()
+        self.runs = []
+
+    def run(self, changed_paths):
+        self.runs.append(set(changed_paths) if changed_paths is not None else None)
+        if self.cancelled:
+            raise BuildCancelled
+        with open(os.path.join(self.output_directory, 'index.html'), 'wb') as f:
+            f.write(self.content)
+        self.done.set()
+
+    def prioritize(self, output_paths, timeout):
+        return self.done.wait(timeout)
+
+
+def create_server(tmp_path):
+    source_directory = tmp_path / 'src'
+    output_directory = tmp_path / 'out'
+    source_directory.mkdir()
+    output_directory.mkdir()
+    server = Server(str(source_directory))
+    server.request_timeout = 5
+    server.builder = MockBuilder(str(output_directory))
+    server.get_builder = lambda tmp_directory: server.builder
+    return server, str(source_directory), str(output_directory)
+
+
+def test_request_waits_for_fresh_output(tmp_path):
+    server, source_directory, output_directory = create_server(tmp_path)
+    with open(os.path.join(output_directory, 'index.html'), 'wb') as f:
+        f.write(b'<body>stale</body>')
+    server.event_handler.add_paths(os.path.join(source_directory, 'index.html'))
+
+    responses = []
+    client = create_app(output_directory, {}, server.prepare).test_client()
+    thread = threading.Thread(target=lambda: responses.append(client.get('/')))
+    thread.start()
+
+    # The request starts the compilation without waiting for more events.
+    assert server.compile_requested.wait(5)
+    assert not responses
+    server.compile(output_directory, {}, server.event_handler.pop_paths())
+    thread.join(5)
+    assert b'fresh' in responses[0].data
+
+
+def test_cancelled_compilation_keeps_changed_paths(tmp_path):
+    server, source_directory, output_directory = create_server(tmp_path)
+    server.changed_paths = set()
+    status = {}
+
+    server.builder.cancelled = True
+    server.compile(output_directory, status, [os.path.join(source_directory, 'a.md')])
+    assert server.changed_paths == {'a.md'}
+    assert not 'compilationTimestamp' in status
+
+    server.builder.cancelled = False
+    server.compile(output_directory, status, [os.path.join(source_directory, 'b.md')])
+    assert server.builder.runs[-1] == {'a.md', 'b.md'}
+    assert server.changed_paths == set()
+    assert 'compilationTimestamp' in status
+
+
+def test_memory_outputs_conditional_requests(tmp_path):
+    outputs = MemoryOutputs(str(tmp_path))
+    outputs.write('index.html', b'<body>content</body>')
+    client = create_app(str(tmp_path), {}, outputs=outputs).test_client()
+
+    response = client.get('/')
+    assert response.status_code == 200
+    assert b'content' in response.data
+    etag = response.headers['ETag']
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    outputs.write('index.html', b'<body>changed</body>')
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'changed' in response.data
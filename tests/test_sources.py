@@ -0,0 +1,128 @@
+from basilisk.build import Build
+import os
+import hashlib
+from basilisk.sources import SourceStore, ParametersIndex, DigestIndex
+
+
+class CountingBuild(Build):
+
+    def __init__(self, input_path, content):
+        super().__init__(input_path, input_path)
+        self.content = content
+        self.reads = 0
+
+    def read(self, path):
+        self.reads += 1
+        return self.content
+
+
+def test_single_read():
+    sources = SourceStore('source_directory')
+    build = CountingBuild('file.md', b'title: Title\n\nContent')
+    assert sources.parameters(build) == {'title': 'Title'}
+    assert sources.extract(build) == (b'Content', {'title': 'Title'})
+    assert len(sources.digest(build)) == 32
+    assert sources.read(build) is sources.read(build)
+    assert build.reads == 1
+
+
+def test_large_contents_are_not_kept():
+    sources = SourceStore('source_directory')
+    sources.max_entry_size = 10
+    build = CountingBuild('file.bin', b'0' * 11)
+    sources.parameters(build)
+    assert build.reads == 1
+    sources.digest(build)
+    sources.parameters(build)
+    assert build.reads == 1
+    sources.read(build)
+    assert build.reads == 2
+
+
+def test_eviction():
+    sources = SourceStore('source_directory')
+    sources.max_size = 10
+    first = CountingBuild('first', b'0' * 6)
+    second = CountingBuild('second', b'0' * 6)
+    sources.read(first)
+    sources.read(second)
+    assert sources.size == 6
+    sources.read(second)
+    assert second.reads == 1
+    sources.read(first)
+    assert first.reads == 2
+
+
+def test_parameters_index(tmp_path):
+    path = tmp_path / 'file.md'
+    path.write_bytes(b'title: Title\n\nContent')
+    stat = path.stat()
+    index_path = str(tmp_path / 'index' / 'parameters.sqlite')
+
+    index = ParametersIndex(index_path, str(tmp_path))
+    index.min_age = 0
+    assert index.get(str(path), stat) is None
+    index.put(str(path), stat, {'title': 'Title'})
+    index.save()
+
+    index = ParametersIndex(index_path, str(tmp_path))
+    assert index.get(str(path), stat) == {'title': 'Title'}
+
+    path.write_bytes(b'title: Changed\n\nContent')
+    assert index.get(str(path), path.stat()) is None
+
+
+def test_parameters_from_index(tmp_path):
+    (tmp_path / 'file.md').write_bytes(b'title: Title\n\nContent')
+    index = ParametersIndex(str(tmp_path / 'parameters.sqlite'), str(tmp_path))
+    index.min_age = 0
+
+    sources = SourceStore(str(tmp_path), index)
+    build = Build('file.md', 'file.md')
+    sources.prefetch_parameters([build])
+    sources.save()
+
+    def read(build):
+        raise AssertionError('file was read')
+
+    sources = SourceStore(str(tmp_path), index)
+    sources.read = read
+    assert sources.parameters(build) == {'title': 'Title'}
+
+
+def test_digest_from_index(tmp_path):
+    content = os.urandom(3 * 1024 * 1024)
+    (tmp_path / 'video.mp4').write_bytes(content)
+    index = DigestIndex(str(tmp_path / 'digests.sqlite'), str(tmp_path))
+    index.min_age = 0
+
+    build = Build('video.mp4', 'video.mp4')
+    sources = SourceStore(str(tmp_path), digest_index=index)
+    assert sources.digest(build) == hashlib.sha256(content).digest()
+    assert sources.entries == {}
+    sources.save()
+
+    # The file is not hashed again so nothing is added to the index.
+    sources = SourceStore(str(tmp_path), digest_index=index)
+    sources.digest_index.put = None
+    assert sources.digest(build) == hashlib.sha256(content).digest()
+
+
+def test_read_records_digest(tmp_path):
+    (tmp_path / 'file.md').write_bytes(b'content')
+    build = Build('file.md', 'file.md')
+    sources = SourceStore(str(tmp_path))
+    sources.read(build)
+    sources.digest_file = None
+    assert sources.digest(build) == hashlib.sha256(b'content').digest()
+
+
+def test_recorded_stats_are_used(tmp_path):
+    (tmp_path / 'file.md').write_bytes(b'content')
+    sources = SourceStore(str(tmp_path))
+    build = Build('file.md', 'file.md')
+    stat = os.stat(str(tmp_path / 'file.md'))
+    sources.add_stat('file.md', os.stat_result((0,) * 6 + (1, 0, 0, 0)))
+    assert sources.stat(build).st_size == 1
+    sources.clear()
+    assert sources.stat(build).st_size == stat.st_size